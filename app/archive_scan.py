@@ -0,0 +1,159 @@
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
+
+from app.constants import ARCHIVE_SCAN_WORKERS
+
+# ==================================================
+# قراءة أرشيف records بالتوازي
+# ==================================================
+
+def read_record_columns(file_path, columns=("اسم", "الحضور")):
+    """
+    يقرأ أعمدة محددة فقط من ملف يوم أنشأه export_data ويعيد {اسم العمود: القيم}.
+    يحاول أولًا قراءة XML الورقة مباشرة، وإذا كانت بنية الملف غير متوقعة
+    يرجع إلى openpyxl بوضع read_only.
+    """
+    try:
+        return _read_columns_xml(file_path, columns)
+    except KeyError:
+        raise
+    except Exception:
+        return _read_columns_openpyxl(file_path, columns)
+
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _read_columns_xml(file_path, columns):
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        sheet_name = min(
+            n for n in names
+            if n.startswith("xl/worksheets/sheet") and n.endswith(".xml")
+        )
+
+        shared_strings = []
+        if "xl/sharedStrings.xml" in names:
+            with archive.open("xl/sharedStrings.xml") as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag == _SHEET_NS + "si":
+                        shared_strings.append("".join(t.text or "" for t in element.iter(_SHEET_NS + "t")))
+                        element.clear()
+
+        wanted = None
+        values = {column: [] for column in columns}
+
+        with archive.open(sheet_name) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag != _SHEET_NS + "row":
+                    continue
+
+                row = {}
+                for cell in element.iter(_SHEET_NS + "c"):
+                    letters = cell.get("r", "").rstrip("0123456789")
+                    if wanted is not None and letters not in wanted:
+                        continue
+                    row[letters] = _cell_value(cell, shared_strings)
+                element.clear()
+
+                if wanted is None:
+                    header = {value: letters for letters, value in row.items()}
+                    for column in columns:
+                        if column not in header:
+                            raise KeyError(column)
+                    wanted = {header[column]: column for column in columns}
+                    continue
+
+                for letters, column in wanted.items():
+                    values[column].append(row.get(letters))
+
+        return values
+
+
+def _cell_value(cell, shared_strings):
+    cell_type = cell.get("t")
+    if cell_type == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(_SHEET_NS + "t")) or None
+
+    v = cell.find(_SHEET_NS + "v")
+    if v is None or v.text is None:
+        return None
+    if cell_type == "s":
+        return shared_strings[int(v.text)]
+    if cell_type in ("str", "e"):
+        return v.text
+    if cell_type == "b":
+        return v.text == "1"
+    number = float(v.text)
+    return int(number) if number.is_integer() else number
+
+
+def _read_columns_openpyxl(file_path, columns):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        indexes = []
+        for column in columns:
+            if column not in header:
+                raise KeyError(column)
+            indexes.append(header.index(column))
+
+        values = {column: [] for column in columns}
+        for row in ws.iter_rows(min_row=2, max_col=max(indexes) + 1, values_only=True):
+            for column, index in zip(columns, indexes):
+                values[column].append(row[index] if index < len(row) else None)
+        return values
+    finally:
+        wb.close()
+
+
+def read_day_statuses(file_path):
+    """
+    يعيد {اسم الطالب: True إذا كان غائبًا} من ملف يوم واحد.
+    """
+    values = read_record_columns(file_path)
+    return {
+        name: status == "غياب"
+        for name, status in zip(values["اسم"], values["الحضور"])
+        if name is not None
+    }
+
+
+def _safe_read(file_path):
+    try:
+        return read_day_statuses(file_path)
+    except Exception:
+        return {}
+
+
+def scan_archive_files(file_paths, workers=ARCHIVE_SCAN_WORKERS, progress=None):
+    """
+    يوزع الملفات على عدة عمليات ويجمع النتائج في {مسار الملف: الحالات}.
+    progress(done, total) يُستدعى بعد كل ملف من الخيط الذي طلب الفحص.
+    """
+    file_paths = list(file_paths)
+    total = len(file_paths)
+    results = {}
+
+    if total < 2 or workers == 1:
+        for done, file_path in enumerate(file_paths, 1):
+            results[file_path] = _safe_read(file_path)
+            if progress:
+                progress(done, total)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_safe_read, file_path): file_path for file_path in file_paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception:
+                results[futures[future]] = {}
+            if progress:
+                progress(done, total)
+
+    return results
@@ -0,0 +1,241 @@
+import atexit
+import threading
+from datetime import datetime
+
+from app.constants import ATTENDANCE_JOURNAL_MAX_BYTES
+from app.storage import (
+    append_attendance_events,
+    compact_stage_department_attendance,
+    get_attendance_journal_size,
+    get_student_ids_by_name,
+    save_stage_department_attendance
+)
+from app.models import (
+    ARRIVAL,
+    DEPARTURE,
+    EVENT_CODES,
+    EXPORT_MARK_KEY,
+    AttendanceEntry,
+    attendance_to_json
+)
+
+
+def next_operation(day_records):
+    if not day_records:
+        return ARRIVAL
+    return DEPARTURE if day_records[-1].kind == ARRIVAL else ARRIVAL
+
+
+# ==================================================
+# مخزن الحضور في الذاكرة مع سجل تراكمي
+# ==================================================
+
+class AttendanceStore:
+    """
+    يحتفظ بسجلات كل مرحلة/قسم في الذاكرة. كل تسجيل يُضاف كسطر واحد
+    إلى السجل التراكمي للصف، ويُدمج السجل في ملف الصف عند أول تحميل،
+    وعند flush() (التصدير / الإغلاق)، أو إذا تجاوز حجمه max_journal_bytes.
+    """
+
+    def __init__(self, max_journal_bytes=ATTENDANCE_JOURNAL_MAX_BYTES):
+        self.max_journal_bytes = max_journal_bytes
+
+        self._classes = {}
+        self._export_marks = {}
+        self._dirty = set()
+        self._changed = set()
+        self._lock = threading.RLock()
+
+    def get(self, stage, department):
+        with self._lock:
+            class_id = (stage, department)
+            if class_id not in self._classes:
+                attendance = compact_stage_department_attendance(stage, department)
+                self._export_marks[class_id] = attendance.pop(EXPORT_MARK_KEY, None)
+                attendance, migrated = self._keyed_by_id(stage, department, attendance)
+                self._classes[class_id] = attendance
+                if migrated:
+                    self._compact(stage, department)
+                # التصدير يصفّر الحضور، فوجود سجلات يعني أحداثًا بعد آخر تصدير
+                if attendance:
+                    self._changed.add(class_id)
+            return self._classes[class_id]
+
+    def record(self, student, operation=None):
+        return self.record_many([student], operation)[0]
+
+    def record_many(self, students, operation=None):
+        """
+        يسجل دفعة من الطلاب بكتابة واحدة في السجل التراكمي لكل صف.
+        يعيد الأحداث بنفس ترتيب الطلاب.
+        """
+        now = datetime.now()
+        current_date = now.strftime("%Y-%m-%d")
+
+        if isinstance(operation, str):
+            operation = EVENT_CODES[operation]
+
+        entries = []
+        events = {}
+        with self._lock:
+            for student in students:
+                class_id = (student["stage"], student["department"])
+                attendance = self.get(*class_id)
+                day_records = attendance.setdefault(student["id"], {}).setdefault(current_date, [])
+
+                op = operation if operation is not None else next_operation(day_records)
+                entry = AttendanceEntry(op, now.hour * 60 + now.minute)
+                day_records.append(entry)
+                entries.append(entry)
+
+                events.setdefault(class_id, []).append(
+                    (student["id"], current_date, entry.to_dict(), len(day_records) - 1)
+                )
+
+            for (stage, department), class_events in events.items():
+                append_attendance_events(stage, department, class_events)
+                self._dirty.add((stage, department))
+                self._changed.add((stage, department))
+
+                if get_attendance_journal_size(stage, department) > self.max_journal_bytes:
+                    self._compact(stage, department)
+
+        return entries
+
+    def snapshot(self, stage, department):
+        # AttendanceEntry غير قابل للتعديل، فنسخ القوائم يكفي
+        with self._lock:
+            return {
+                student_id: {date: list(records) for date, records in dates.items()}
+                for student_id, dates in self.get(stage, department).items()
+            }
+
+    def export_mark(self, stage, department):
+        with self._lock:
+            self.get(stage, department)
+            return self._export_marks.get((stage, department))
+
+    def snapshot_student(self, stage, department, student_id):
+        with self._lock:
+            dates = self.get(stage, department).get(student_id, {})
+            return {date: list(records) for date, records in dates.items()}
+
+    def discard_exported(self, stage, department, counts, export_id=None):
+        """
+        counts: {مفتاح الطالب: {التاريخ: عدد السجلات المصدّرة}}
+        يحذف السجلات المصدّرة فقط، فتبقى أي تسجيلات وصلت أثناء التصدير.
+        export_id يُحفظ مع الصف، ولا يُعاد الحذف إذا كان التصدير نفسه قد صفّره.
+        """
+        with self._lock:
+            attendance = self.get(stage, department)
+            if export_id is not None and self._export_marks.get((stage, department)) == export_id:
+                return True
+            for student_key, dates in counts.items():
+                # مفاتيح نقطة الاستكمال نصية بعد حفظها في JSON
+                student_key = int(student_key)
+                student_days = attendance.get(student_key)
+                if student_days is None:
+                    continue
+                for date, count in dates.items():
+                    day_records = student_days.get(date)
+                    if day_records is None:
+                        continue
+                    del day_records[:count]
+                    if not day_records:
+                        del student_days[date]
+                if not student_days:
+                    del attendance[student_key]
+
+            if not attendance:
+                self._changed.discard((stage, department))
+            if export_id is not None:
+                self._export_marks[(stage, department)] = export_id
+            return self._compact(stage, department)
+
+    def transfer(self, source_stage, source_department, target_stage, target_department, student_ids):
+        """
+        ينقل سجلات الطلاب إلى ملف الصف الجديد بنفس الرقم، ثم يحفظ الصفين.
+        """
+        with self._lock:
+            source = self.get(source_stage, source_department)
+            target = self.get(target_stage, target_department)
+
+            moved = False
+            for student_id in student_ids:
+                student_days = source.pop(student_id, None)
+                if not student_days:
+                    continue
+
+                target_days = target.setdefault(student_id, {})
+                for date, records in student_days.items():
+                    target_days.setdefault(date, []).extend(records)
+                moved = True
+
+            if not moved:
+                return True
+
+            if not source:
+                self._changed.discard((source_stage, source_department))
+            self._changed.add((target_stage, target_department))
+
+            ok = self._compact(target_stage, target_department)
+            return self._compact(source_stage, source_department) and ok
+
+    def is_changed(self, stage, department):
+        with self._lock:
+            self.get(stage, department)
+            return (stage, department) in self._changed
+
+    def flush(self):
+        with self._lock:
+            ok = True
+            for stage, department in list(self._dirty):
+                ok = self._compact(stage, department) and ok
+            return ok
+
+    def close(self):
+        self.flush()
+
+    def _keyed_by_id(self, stage, department, attendance):
+        """
+        يحول مفاتيح الملف إلى أرقام الطلاب، ومنها المفاتيح القديمة
+        name|stage|department، والسجلات إلى AttendanceEntry.
+        يعيد (الحضور، هل وُجدت مفاتيح قديمة).
+        """
+        converted = {}
+        migrated = False
+        ids_by_name = None
+
+        for student_key, dates in attendance.items():
+            if isinstance(student_key, int) or student_key.isdigit():
+                student_id = int(student_key)
+            else:
+                migrated = True
+                if ids_by_name is None:
+                    ids_by_name = get_student_ids_by_name(stage, department)
+                student_id = ids_by_name.get(student_key.split("|")[0])
+                if student_id is None:
+                    print(f"تم تجاهل سجلات حضور لطالب غير موجود: {student_key}")
+                    continue
+
+            student_days = converted.setdefault(student_id, {})
+            for date, records in dates.items():
+                student_days.setdefault(date, []).extend(
+                    AttendanceEntry.from_dict(r) for r in records
+                )
+
+        return converted, migrated
+
+    def _compact(self, stage, department):
+        attendance = attendance_to_json(self._classes[(stage, department)])
+        export_mark = self._export_marks.get((stage, department))
+        if export_mark is not None:
+            attendance[EXPORT_MARK_KEY] = export_mark
+        if save_stage_department_attendance(stage, department, attendance):
+            self._dirty.discard((stage, department))
+            return True
+        return False
+
+
+attendance_store = AttendanceStore()
+atexit.register(attendance_store.close)
@@ -0,0 +1,119 @@
+import threading
+
+from app.constants import CARDS_INDEX_FILE
+from app.storage import (
+    load_cards,
+    save_cards,
+    load_data,
+    save_data,
+    get_student,
+    get_student_ids_by_name
+)
+
+# ==================================================
+# البطاقات مع فهرس عكسي من الطالب إلى UID
+# ==================================================
+
+class CardRegistry:
+    """
+    cards: {UID: رقم الطالب} كما في cards.json
+    index: {رقم الطالب: [UID, ...]} محفوظ في cards_index.json
+    البطاقة مربوطة برقم الطالب، فنقل الطالب لا يغير البطاقات.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.cards = load_cards()
+        if self._migrate_legacy_cards():
+            save_cards(self.cards)
+
+        self.index = {
+            int(student_id): uids
+            for student_id, uids in load_data(CARDS_INDEX_FILE, {}).items()
+        }
+        if not self._index_matches():
+            self.index = self._build_index()
+            save_data(CARDS_INDEX_FILE, self.index)
+
+    def _migrate_legacy_cards(self):
+        """
+        البطاقات القديمة محفوظة كبيانات الطالب بدل رقمه.
+        """
+        ids_by_class = {}
+        migrated = False
+
+        for uid, student in list(self.cards.items()):
+            if not isinstance(student, dict):
+                continue
+            migrated = True
+
+            class_id = (student["stage"], student["department"])
+            if class_id not in ids_by_class:
+                ids_by_class[class_id] = get_student_ids_by_name(*class_id)
+
+            student_id = ids_by_class[class_id].get(student["name"])
+            if student_id is None:
+                print(f"تم تجاهل بطاقة {uid} لطالب غير موجود: {student['name']}")
+                del self.cards[uid]
+            else:
+                self.cards[uid] = student_id
+
+        return migrated
+
+    def _build_index(self):
+        index = {}
+        for uid, student_id in self.cards.items():
+            index.setdefault(student_id, []).append(uid)
+        return index
+
+    def _index_matches(self):
+        if sum(len(uids) for uids in self.index.values()) != len(self.cards):
+            return False
+        for student_id, uids in self.index.items():
+            for uid in uids:
+                if self.cards.get(uid) != student_id:
+                    return False
+        return True
+
+    def __contains__(self, uid):
+        return uid in self.cards
+
+    def lookup(self, uid):
+        student_id = self.cards.get(uid)
+        if student_id is None:
+            return None
+        return get_student(student_id)
+
+    def uids_for(self, student):
+        return self.index.get(student["id"], [])
+
+    def has_card(self, student):
+        return student["id"] in self.index
+
+    def bind(self, uid, student, replace=False):
+        """
+        replace=True يلغي بطاقات الطالب السابقة (بطاقة مفقودة مثلًا).
+        """
+        with self._lock:
+            if replace:
+                for old_uid in self.index.pop(student["id"], []):
+                    self.cards.pop(old_uid, None)
+            self._unlink(uid)
+            self.cards[uid] = student["id"]
+            self.index.setdefault(student["id"], []).append(uid)
+
+    def save(self):
+        with self._lock:
+            if not save_cards(self.cards):
+                return False
+            return save_data(CARDS_INDEX_FILE, self.index)
+
+    def _unlink(self, uid):
+        student_id = self.cards.get(uid)
+        if student_id is None:
+            return
+        uids = self.index.get(student_id, [])
+        if uid in uids:
+            uids.remove(uid)
+        if not uids:
+            self.index.pop(student_id, None)
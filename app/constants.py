@@ -21,11 +21,48 @@ PROGRAM_STORAGE = "data"
 STUDENTS_FOLDER = f"{PROGRAM_STORAGE}/students"
 ATTENDANCE_FOLDER = f"{PROGRAM_STORAGE}/attendance"
 CARDS_FILE = f"{PROGRAM_STORAGE}/cards.json"
+CARDS_INDEX_FILE = f"{PROGRAM_STORAGE}/cards_index.json"
+STUDENT_IDS_FILE = f"{PROGRAM_STORAGE}/student_ids.json"
 STAGES_FILE = f"{PROGRAM_STORAGE}/stages.json"
+DATABASE_FILE = f"{PROGRAM_STORAGE}/attendance.db"
+EXPORT_STATE_FILE = f"{PROGRAM_STORAGE}/export_state.json"
+EXPORT_CHECKPOINT_FILE = f"{PROGRAM_STORAGE}/export_checkpoint.json"
+# "json" أو "sqlite"
+STORAGE_BACKEND = "json"
+# "full": مزامنة كل كتابة مع القرص، "batched": مزامنة مجمّعة كل FSYNC_BATCH_INTERVAL ثانية
+WRITE_DURABILITY = "batched"
+FSYNC_BATCH_INTERVAL = 1.0
 RECORDS_FOLDER = "records"
+LEDGER_FOLDER = f"{PROGRAM_STORAGE}/ledger"
+REPORTS_FOLDER = "reports"
+# None = عدد أنوية المعالج
+ARCHIVE_SCAN_WORKERS = None
+# كتابة ملف الصف تأخذ عشرات الملي ثانية، وتشغيل عملية جديدة على Windows
+# (spawn) يعيد استيراد openpyxl ويكلف أكثر من ذلك، فالتصدير متسلسل افتراضيًا.
+# مع عدة عمليات لا يُستخدم التوازي إلا إذا بلغ عدد الصفوف EXPORT_PARALLEL_MIN_JOBS
+EXPORT_WORKERS = 1
+EXPORT_PARALLEL_MIN_JOBS = 64
 BAUD_RATE = 9600
+# أقصى انتظار لأول بايت في كل قراءة، وهو أيضًا أقصى زمن لإيقاف القارئ
+SERIAL_READ_TIMEOUT = 0.05
+# المنافذ التي يحتوي وصفها إحدى هذه الكلمات تُفتح كقارئات تلقائيًا
+READER_PORT_KEYWORDS = ["Arduino", "CH340", "USB Serial"]
+# كل كم ثانية تُفحص المنافذ لإضافة القارئات الموصولة وإزالة المفصولة
+READER_SCAN_INTERVAL = 2.0
+# اسم البوابة لكل منفذ، مثل {"COM3": "البوابة الرئيسية"}، وإلا يظهر اسم المنفذ
+GATE_NAMES = {}
+# أقصى عدد قراءات تنتظر الواجهة، وبعدها ينتظر القارئ حتى CARD_QUEUE_PUT_TIMEOUT ثم تُهمل القراءة
+CARD_QUEUE_SIZE = 256
+CARD_QUEUE_PUT_TIMEOUT = 1.0
+# كل كم ملي ثانية تعالج الواجهة القراءات المنتظرة كدفعة واحدة
+CARD_DRAIN_INTERVAL_MS = 50
+# تكرار نفس البطاقة خلال هذه المدة بالثواني يُهمل (بطاقة مثبتة على القارئ أو نقر مزدوج)
+CARD_DEBOUNCE_SECONDS = 2.0
 WINDOW_WIDTH = 900
 WINDOW_HEIGHT = 600
 DEFAULT_FONT = ("Arial", 10)
 TITLE_FONT = ("Arial", 18, "bold")
 CLOCK_FONT = ("Arial", 14, "bold")
+ATTENDANCE_JOURNAL_MAX_BYTES = 256 * 1024
+# الزمن المستهدف بالثواني من تشغيل البرنامج حتى ظهور النافذة
+STARTUP_TARGET_SECONDS = 0.5
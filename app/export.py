@@ -1,182 +1,433 @@
+import hashlib
 import os
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Alignment, Font, Border, Side
 from openpyxl.worksheet.page import PageMargins
+from openpyxl.worksheet.worksheet import Worksheet
 from tkinter import messagebox
 from app.constants import (
     STAGES,
     DEPARTMENTS,
-    RECORDS_FOLDER
+    RECORDS_FOLDER,
+    EXPORT_WORKERS,
+    EXPORT_PARALLEL_MIN_JOBS,
+    EXPORT_STATE_FILE,
+    EXPORT_CHECKPOINT_FILE
 )
 from app.storage import (
-    load_stage_department_students,
-    load_stage_department_attendance,
-    save_stage_department_attendance
+    load_data,
+    save_data,
+    data_exists,
+    delete_data,
+    get_stage_department_path,
+    load_stage_department_students
 )
+from app.archive_scan import read_record_columns
+from app.attendance_store import attendance_store
+from app.models import ARRIVAL, DEPARTURE
+from app.ledger import record_day
+
+COLUMNS = [
+    "ت", "اسم", "المرحلة", "القسم",
+    "تاريخ", "الحضور", "الانصراف", "ملاحظات"
+]
+
+COLUMN_WIDTHS = {
+    "A": 5, "B": 25, "C": 15, "D": 15,
+    "E": 12, "F": 12, "G": 12, "H": 25
+}
+
+_thin = Side(style="thin")
+_border = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+_center = Alignment(horizontal="center", vertical="center")
+
+# النمط لكل عنوان عمود، ونمط واحد لكل خلايا البيانات
+STYLE_SPECS = {
+    "export_header_yellow": (Font(bold=True, size=14), PatternFill("solid", start_color="FFFF00")),
+    "export_header_gray": (Font(bold=True, size=14), PatternFill("solid", start_color="D3D3D3")),
+    "export_header_green": (Font(bold=True, size=14), PatternFill("solid", start_color="9BBB59")),
+    "export_header_blue": (Font(bold=True, size=14), PatternFill("solid", start_color="87CEEB")),
+    "export_data": (Font(size=12), PatternFill("solid", start_color="F0F8FF")),
+}
+
+HEADER_STYLES = {
+    "ت": "export_header_yellow",
+    "الحضور": "export_header_green",
+    "الانصراف": "export_header_blue",
+}
+
+
+def build_class_rows(students, attendance, stage, department, today_date, previous=None):
+    """
+    previous: {اسم: (أوقات الحضور، أوقات الانصراف)} من ملف اليوم إذا صُدّر سابقًا،
+    حتى لا تضيع سجلات ما قبل التصدير الأول عند إعادة التصدير. هذه السجلات
+    صُفّرت من الحضور بعد تصديرها، فتُضاف إليها السجلات الحالية كما هي دون
+    مقارنة الأوقات، وتبقى الأحداث المتكررة في نفس الدقيقة.
+    """
+    previous = previous or {}
+    data = []
+
+    for student in students:
+        student_id = student["id"]
+        attendance_times, departure_times = previous.get(student["name"], ([], []))
+        attendance_times = list(attendance_times)
+        departure_times = list(departure_times)
+
+        if (
+            student_id in attendance
+            and today_date in attendance[student_id]
+        ):
+            records = attendance[student_id][today_date]
+            for r in records:
+                if r.kind == ARRIVAL:
+                    attendance_times.append(r.time_text)
+                elif r.kind == DEPARTURE:
+                    departure_times.append(r.time_text)
+
+        attendance_time = (
+            "\n".join(attendance_times)
+            if attendance_times else "غياب"
+        )
+        departure_time = (
+            "\n".join(departure_times)
+            if departure_times else
+            ("غياب" if attendance_times == [] else "لم ينصرف")
+        )
 
-def export_data():
+        data.append({
+            "number": len(data) + 1,
+            "id": student["id"],
+            "name": student["name"],
+            "stage": stage,
+            "department": department,
+            "date": today_date,
+            "attendance": attendance_time,
+            "departure": departure_time,
+            "notes": ""
+        })
+
+    data.sort(key=lambda x: x["name"])
+    for i, item in enumerate(data, 1):
+        item["number"] = i
+
+    return data
+
+
+def read_previous_rows(file_path):
+    if not os.path.exists(file_path):
+        return {}
+
+    values = read_record_columns(file_path, ("اسم", "الحضور", "الانصراف"))
+    previous = {}
+    for name, attendance_time, departure_time in zip(
+        values["اسم"], values["الحضور"], values["الانصراف"]
+    ):
+        previous[name] = (
+            [t for t in str(attendance_time or "").split("\n") if t and t != "غياب"],
+            [t for t in str(departure_time or "").split("\n") if t and t not in ("غياب", "لم ينصرف")]
+        )
+    return previous
+
+
+def roster_signature(students):
+    names = "\n".join(sorted(s["name"] for s in students))
+    return hashlib.sha1(names.encode("utf-8")).hexdigest()
+
+
+def write_class_workbook(file_path, data):
+    """
+    يكتب ملف الصف المنسق (من اليمين لليسار، A4 بالعرض) في مرور واحد
+    باستخدام وضع write_only والأنماط المسماة.
+    """
+    wb = Workbook(write_only=True)
+    for name, (font, fill) in STYLE_SPECS.items():
+        wb.add_named_style(NamedStyle(
+            name=name, font=font, fill=fill, border=_border, alignment=_center
+        ))
+
+    ws = wb.create_sheet()
+    ws.sheet_view.rightToLeft = True
+
+    for letter, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[letter].width = width
+
+    ws.page_margins = PageMargins(
+        left=0.3, right=0.3,
+        top=0.4, bottom=0.4,
+        header=0.3, footer=0.3
+    )
+
+    ws.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE
+    ws.page_setup.paperSize = Worksheet.PAPERSIZE_A4
+    ws.page_setup.fitToWidth = 1
+    ws.page_setup.fitToHeight = 0
+
+    header = []
+    for column in COLUMNS:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.style = HEADER_STYLES.get(column, "export_header_gray")
+        header.append(cell)
+    ws.append(header)
+
+    for item in data:
+        row = []
+        for value in (
+            item["number"],
+            item["name"],
+            item["stage"],
+            item["department"],
+            item["date"],
+            item["attendance"],
+            item["departure"],
+            item["notes"]
+        ):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = "export_data"
+            row.append(cell)
+        ws.append(row)
+
+    wb.save(file_path)
+
+
+def write_class_workbooks(jobs, on_written, workers=EXPORT_WORKERS):
+    """
+    jobs: قائمة (مسار الملف، صفوف الصف). كل ملف مستقل، فتُكتب بالتوازي
+    عبر عدة عمليات إذا سُمح بأكثر من عملية وكانت الصفوف كثيرة بما يغطي كلفة
+    تشغيلها، ويُستدعى on_written(مسار الملف) في هذا الخيط بعد كل ملف.
+    تعيد قائمة (مسار الملف، الخطأ) للملفات التي فشلت.
+    """
+    failures = []
+
+    if len(jobs) < EXPORT_PARALLEL_MIN_JOBS or workers == 1:
+        for file_path, data in jobs:
+            try:
+                write_class_workbook(file_path, data)
+                on_written(file_path)
+            except Exception as e:
+                failures.append((file_path, e))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(write_class_workbook, file_path, data): file_path
+            for file_path, data in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                on_written(futures[future])
+            except Exception as e:
+                failures.append((futures[future], e))
+
+    return failures
+
+
+# ==================================================
+# التصدير كمعاملة قابلة للاستكمال
+# ==================================================
+#
+# data/export_checkpoint.json:
+#   {"id": ..., "date": ..., "phase": "write" | "reset",
+#    "classes": {مسار الصف: {"stage", "department", "signature", "counts",
+#                            "previous": {التاريخ: صفوف الملف قبل التصدير}}},
+#    "committed": [...], "reset": [...]}
+# يُصدَّر كل تاريخ له سجلات في الصف، لا يوم التصدير وحده، لأن التصفير
+# يحذف كل السجلات المعدودة. صفوف الملفات السابقة تُقرأ عند التخطيط فقط،
+# فالاستكمال لا يقرأ ملفًا كتبه التصدير نفسه ولا يكرر أوقاته.
+# كل صف يُكتب لملفات مؤقتة ثم تُستبدل ويُسجل في committed. تصفير الحضور
+# لا يبدأ إلا بعد اكتمال كل الصفوف، ويُسجل كل صف مصفّر في reset. رقم
+# التصدير id يُحفظ مع حضور الصف في نفس كتابة التصفير، فلا يُصفّر الصف
+# مرتين إذا انقطع التشغيل قبل تسجيله في reset.
+# إذا انقطع التصدير يكمل التشغيل التالي من حيث توقف.
+
+def attendance_counts(attendance):
+    return {
+        student_key: {date: len(records) for date, records in dates.items()}
+        for student_key, dates in attendance.items()
+    }
+
+
+def attendance_for_dates(attendance, export_dates):
+    return {
+        student_key: {date: records for date, records in dates.items() if date in export_dates}
+        for student_key, dates in attendance.items()
+        if any(date in export_dates for date in dates)
+    }
+
+
+def get_record_file(stage, department, date):
+    return os.path.join(RECORDS_FOLDER, stage, department, f"{date}.xlsx")
+
+
+def plan_export(export_date, force, snapshots):
+    export_state = load_data(EXPORT_STATE_FILE, {})
+    rosters = export_state.get("rosters", {})
+    classes = {}
+
+    for stage in STAGES:
+        for department in DEPARTMENTS:
+
+            students = load_stage_department_students(stage, department)
+            if not students:
+                continue
+
+            class_path = get_stage_department_path(stage, department)
+            signature = roster_signature(students)
+
+            if (
+                not force
+                and not attendance_store.is_changed(stage, department)
+                and rosters.get(class_path) == signature
+                and os.path.exists(get_record_file(stage, department, export_date))
+            ):
+                continue
+
+            snapshots[class_path] = attendance_store.snapshot(stage, department)
+            dates = {export_date}
+            for student_days in snapshots[class_path].values():
+                dates.update(student_days)
+
+            classes[class_path] = {
+                "stage": stage,
+                "department": department,
+                "signature": signature,
+                "counts": attendance_counts(snapshots[class_path]),
+                "previous": {
+                    date: read_previous_rows(get_record_file(stage, department, date))
+                    for date in sorted(dates)
+                }
+            }
+
+    return {
+        "id": datetime.now().isoformat(),
+        "date": export_date,
+        "phase": "write",
+        "classes": classes,
+        "committed": [],
+        "reset": []
+    }
+
+
+def write_pending_classes(checkpoint, snapshots, workers):
+    pending = {}
+    remaining = {}
+    jobs = []
+
+    for class_path, info in checkpoint["classes"].items():
+        if class_path in checkpoint["committed"]:
+            continue
+
+        stage, department = info["stage"], info["department"]
+        if "previous" not in info:
+            # نقاط الاستكمال القديمة تصدّر يومها فقط ولم تحفظ الصفوف السابقة
+            export_date = checkpoint["date"]
+            info["previous"] = {
+                export_date: read_previous_rows(get_record_file(stage, department, export_date))
+            }
+
+        if class_path not in snapshots:
+            # استكمال بعد انقطاع: نأخذ حضور التواريخ المخطط لها فقط، فتسجيلات
+            # الأيام اللاحقة لا تُكتب في ملفات هذا التصدير ويجب ألا تُصفّر معه
+            snapshots[class_path] = attendance_for_dates(
+                attendance_store.snapshot(stage, department), info["previous"]
+            )
+            info["counts"] = attendance_counts(snapshots[class_path])
+
+        students = load_stage_department_students(stage, department)
+        remaining[class_path] = len(info["previous"])
+
+        for date, previous in info["previous"].items():
+            file_path = get_record_file(stage, department, date)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+            data = build_class_rows(
+                students, snapshots[class_path], stage, department, date, previous
+            )
+            tmp_path = file_path + ".tmp"
+            pending[tmp_path] = (class_path, file_path, date, data)
+            jobs.append((tmp_path, data))
+
+    export_state = load_data(EXPORT_STATE_FILE, {})
+    rosters = export_state.setdefault("rosters", {})
+
+    def commit_file(tmp_path):
+        class_path, file_path, date, data = pending[tmp_path]
+        info = checkpoint["classes"][class_path]
+
+        os.replace(tmp_path, file_path)
+        record_day(info["stage"], info["department"], date, {
+            str(item["id"]): item["attendance"] == "غياب" for item in data
+        })
+
+        remaining[class_path] -= 1
+        if remaining[class_path]:
+            return
+
+        rosters[class_path] = info["signature"]
+        save_data(EXPORT_STATE_FILE, export_state)
+
+        checkpoint["committed"].append(class_path)
+        save_data(EXPORT_CHECKPOINT_FILE, checkpoint)
+
+    failures = write_class_workbooks(jobs, commit_file, workers)
+    if failures:
+        raise RuntimeError("\n".join(f"{path}: {error}" for path, error in failures))
+
+
+def reset_exported_attendance(checkpoint):
+    # نقاط الاستكمال القديمة بلا رقم، وتاريخها لا يطابق أي رقم تصدير
+    export_id = checkpoint.setdefault("id", checkpoint["date"])
+    for class_path, info in checkpoint["classes"].items():
+        if class_path in checkpoint["reset"]:
+            continue
+        if not attendance_store.discard_exported(
+            info["stage"], info["department"], info["counts"], export_id
+        ):
+            raise RuntimeError(f"تعذر تصفير حضور {class_path}")
+        checkpoint["reset"].append(class_path)
+        save_data(EXPORT_CHECKPOINT_FILE, checkpoint)
+
+
+def export_data(workers=EXPORT_WORKERS, force=False):
+    """
+    يعيد كتابة ملفات الصفوف التي تغيّر حضورها أو قائمة طلابها منذ آخر تصدير،
+    أو التي لا يوجد لها ملف لهذا اليوم. force=True يعيد كتابة كل الصفوف.
+    يُكتب ملف لكل تاريخ فيه سجلات لم تُصدّر، إضافة إلى ملف اليوم.
+    إذا وُجد تصدير سابق لم يكتمل يُستكمل أولًا بنفس تاريخه.
+    """
     try:
-        today_date = datetime.now().strftime("%Y-%m-%d")
-
-        for stage in STAGES:
-            for department in DEPARTMENTS:
-
-                students = load_stage_department_students(stage, department)
-                attendance = load_stage_department_attendance(stage, department)
-
-                if not students:
-                    continue
-
-                data = []
-
-                for student in students:
-                    student_key = f"{student['name']}|{student['stage']}|{student['department']}"
-
-                    if (
-                        student_key in attendance
-                        and today_date in attendance[student_key]
-                    ):
-                        records = attendance[student_key][today_date]
-                        attendance_times = [
-                            r["time"] for r in records if r["type"] == "حضور"
-                        ]
-                        departure_times = [
-                            r["time"] for r in records if r["type"] == "انصراف"
-                        ]
-
-                        attendance_time = (
-                            "\n".join(attendance_times)
-                            if attendance_times else "غياب"
-                        )
-                        departure_time = (
-                            "\n".join(departure_times)
-                            if departure_times else
-                            ("غياب" if attendance_times == [] else "لم ينصرف")
-                        )
-                    else:
-                        attendance_time = "غياب"
-                        departure_time = "غياب"
-
-                    data.append({
-                        "number": len(data) + 1,
-                        "name": student["name"],
-                        "stage": stage,
-                        "department": department,
-                        "date": today_date,
-                        "attendance": attendance_time,
-                        "departure": departure_time,
-                        "notes": ""
-                    })
-
-                
-                data.sort(key=lambda x: x["name"])
-                for i, item in enumerate(data, 1):
-                    item["number"] = i
-
-                folder_path = os.path.join(RECORDS_FOLDER, stage, department)
-                os.makedirs(folder_path, exist_ok=True)
-
-                file_path = os.path.join(folder_path, f"{today_date}.xlsx")
-
-                columns = [
-                    "ت", "اسم", "المرحلة", "القسم",
-                    "تاريخ", "الحضور", "الانصراف", "ملاحظات"
-                ]
-
-                rows = [
-                    [
-                        item["number"],
-                        item["name"],
-                        item["stage"],
-                        item["department"],
-                        item["date"],
-                        item["attendance"],
-                        item["departure"],
-                        item["notes"]
-                    ]
-                    for item in data
-                ]
-
-                df = pd.DataFrame(rows, columns=columns)
-                df.to_excel(file_path, index=False, engine="openpyxl")
-
-               
-                wb = load_workbook(file_path)
-                ws = wb.active
-                ws.sheet_view.rightToLeft = True
-
-                header_fill_yellow = PatternFill("solid", start_color="FFFF00")
-                header_fill_gray = PatternFill("solid", start_color="D3D3D3")
-                header_fill_green = PatternFill("solid", start_color="9BBB59")
-                header_fill_blue = PatternFill("solid", start_color="87CEEB")
-
-                header_font = Font(bold=True, size=14)
-                data_font = Font(size=12)
-
-                thin = Side(style="thin")
-                border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-                headers = columns
-
-                for col_idx, header in enumerate(headers, start=1):
-                    cell = ws.cell(row=1, column=col_idx)
-                    cell.font = header_font
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                    cell.border = border
-
-                    if header == "ت":
-                        cell.fill = header_fill_yellow
-                    elif header in ["اسم", "المرحلة", "القسم", "تاريخ", "ملاحظات"]:
-                        cell.fill = header_fill_gray
-                    elif header == "الحضور":
-                        cell.fill = header_fill_green
-                    elif header == "الانصراف":
-                        cell.fill = header_fill_blue
-
-                data_fill = PatternFill("solid", start_color="F0F8FF")
-
-                for row in ws.iter_rows(
-                    min_row=2,
-                    max_row=ws.max_row,
-                    min_col=1,
-                    max_col=8
-                ):
-                    for cell in row:
-                        cell.font = data_font
-                        cell.alignment = Alignment(horizontal="center", vertical="center")
-                        cell.fill = data_fill
-                        cell.border = border
-
-                ws.column_dimensions["A"].width = 5
-                ws.column_dimensions["B"].width = 25
-                ws.column_dimensions["C"].width = 15
-                ws.column_dimensions["D"].width = 15
-                ws.column_dimensions["E"].width = 12
-                ws.column_dimensions["F"].width = 12
-                ws.column_dimensions["G"].width = 12
-                ws.column_dimensions["H"].width = 25
-
-                ws.page_margins = PageMargins(
-                    left=0.3, right=0.3,
-                    top=0.4, bottom=0.4,
-                    header=0.3, footer=0.3
-                )
-
-                ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE
-                ws.page_setup.paperSize = ws.PAPERSIZE_A4
-                ws.page_setup.fitToWidth = 1
-                ws.page_setup.fitToHeight = 0
-
-                wb.save(file_path)
-
-        for stage in STAGES:
-            for department in DEPARTMENTS:
-                save_stage_department_attendance(stage, department, {})
-
-        messagebox.showinfo("✅ نجح", "تم تصدير البيانات بنجاح")
+        attendance_store.flush()
+
+        snapshots = {}
+        resumed = data_exists(EXPORT_CHECKPOINT_FILE)
+        if resumed:
+            checkpoint = load_data(EXPORT_CHECKPOINT_FILE, None)
+        if not resumed or not checkpoint:
+            resumed = False
+            export_date = datetime.now().strftime("%Y-%m-%d")
+            checkpoint = plan_export(export_date, force, snapshots)
+            save_data(EXPORT_CHECKPOINT_FILE, checkpoint)
+
+        if checkpoint["phase"] == "write":
+            write_pending_classes(checkpoint, snapshots, workers)
+            checkpoint["phase"] = "reset"
+            save_data(EXPORT_CHECKPOINT_FILE, checkpoint)
+
+        reset_exported_attendance(checkpoint)
+        delete_data(EXPORT_CHECKPOINT_FILE)
+
+        count = len(checkpoint["classes"])
+        if resumed and checkpoint["date"] != datetime.now().strftime("%Y-%m-%d"):
+            messagebox.showinfo(
+                "✅ نجح",
+                f"تم استكمال تصدير يوم {checkpoint['date']} ({count} صف).\nأعد التصدير لتصدير بيانات اليوم."
+            )
+        else:
+            messagebox.showinfo("✅ نجح", f"تم تصدير البيانات بنجاح ({count} صف)")
 
     except Exception as e:
         messagebox.showerror(
@@ -184,4 +435,3 @@ def export_data():
             f"فشل في تصدير البيانات:\n{str(e)}"
         )
         print(traceback.format_exc())
-
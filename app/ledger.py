@@ -0,0 +1,169 @@
+import os
+import threading
+
+from app.constants import (
+    STAGES,
+    DEPARTMENTS,
+    RECORDS_FOLDER,
+    LEDGER_FOLDER,
+    ARCHIVE_SCAN_WORKERS
+)
+from app.storage import (
+    load_data,
+    save_data,
+    get_stage_department_path,
+    get_student_ids_by_name
+)
+from app.archive_scan import scan_archive_files
+
+# ==================================================
+# سجل الغياب المختصر (طالب × يوم) لكل مرحلة/قسم
+# ==================================================
+#
+# الشكل المحفوظ:
+#   {"key": "id", "dates": ["2025-01-05", ...], "students": {"رقم الطالب": "PA-P..."}}
+# كل حرف في نص الطالب يقابل التاريخ بنفس الترتيب:
+#   P حاضر، A غائب، - غير موجود في ملف ذلك اليوم
+
+PRESENT = "P"
+ABSENT = "A"
+MISSING = "-"
+LEDGER_KEY = "id"
+
+_ledgers = {}
+_lock = threading.RLock()
+
+
+def get_ledger_file(stage, department):
+    path = get_stage_department_path(stage, department)
+    return os.path.join(LEDGER_FOLDER, f"{path}.json")
+
+
+def load_ledger(stage, department, records_folder=RECORDS_FOLDER, progress=None):
+    return load_ledgers([(stage, department)], records_folder, progress)[(stage, department)]
+
+
+def load_ledgers(classes, records_folder=RECORDS_FOLDER, progress=None):
+    """
+    يعيد {(مرحلة، قسم): السجل}. السجلات الناقصة تُبنى كلها بفحص واحد
+    للأرشيف بدل فحص لكل صف.
+    """
+    with _lock:
+        missing = {}
+        for class_id in classes:
+            if class_id in _ledgers or class_id in missing:
+                continue
+
+            ledger = None
+            ledger_file = get_ledger_file(*class_id)
+            if os.path.exists(ledger_file):
+                ledger = load_data(ledger_file, None)
+
+            if ledger is None or ledger.get("key") != LEDGER_KEY:
+                # أول استخدام أو سجل قديم بالأسماء: نملأ السجل من ملفات records الموجودة
+                missing[class_id] = list_class_archive(*class_id, records_folder)
+            else:
+                _ledgers[class_id] = ledger
+
+        if missing:
+            scanned = scan_archive_files(
+                [file_path for file_paths in missing.values() for file_path in file_paths],
+                progress=progress
+            )
+            for class_id, file_paths in missing.items():
+                ledger = _ledger_from_scan(*class_id, file_paths, scanned)
+                save_data(get_ledger_file(*class_id), ledger)
+                _ledgers[class_id] = ledger
+
+        return {class_id: _ledgers[class_id] for class_id in classes}
+
+
+def record_day(stage, department, date, statuses, records_folder=RECORDS_FOLDER):
+    """
+    statuses: {رقم الطالب كنص: True إذا كان غائبًا}
+    """
+    with _lock:
+        ledger = load_ledger(stage, department, records_folder)
+        set_day(ledger, date, statuses)
+        return save_data(get_ledger_file(stage, department), ledger)
+
+
+def set_day(ledger, date, statuses):
+    dates = ledger["dates"]
+    students = ledger["students"]
+
+    if date in dates:
+        index = dates.index(date)
+    else:
+        index = len(dates)
+        dates.append(date)
+
+    for name in statuses:
+        if name not in students:
+            students[name] = ""
+
+    for name, marks in students.items():
+        marks = marks.ljust(len(dates), MISSING)
+        if name in statuses:
+            mark = ABSENT if statuses[name] else PRESENT
+        else:
+            mark = MISSING
+        students[name] = marks[:index] + mark + marks[index + 1:]
+
+
+def get_student_absence(student, records_folder=RECORDS_FOLDER, progress=None):
+    ledger = load_ledger(student["stage"], student["department"], records_folder, progress)
+    marks = ledger["students"].get(str(student["id"]), "")
+    return marks.count(ABSENT), len(ledger["dates"])
+
+
+# ==================================================
+# إعادة البناء من أرشيف Excel
+# ==================================================
+
+def list_class_archive(stage, department, records_folder=RECORDS_FOLDER):
+    class_folder = os.path.join(records_folder, stage, department)
+    if not os.path.exists(class_folder):
+        return []
+    return [
+        os.path.join(class_folder, file_name)
+        for file_name in sorted(os.listdir(class_folder))
+        if file_name.endswith(".xlsx")
+    ]
+
+
+def _ledger_from_scan(stage, department, file_paths, scanned):
+    """
+    ملفات Excel تحتوي الأسماء فقط، فنحولها إلى أرقام طلاب الصف الحاليين.
+    """
+    ids_by_name = get_student_ids_by_name(stage, department)
+    ledger = {"key": LEDGER_KEY, "dates": [], "students": {}}
+    for file_path in file_paths:
+        date = os.path.basename(file_path)[:-len(".xlsx")]
+        statuses = {
+            str(ids_by_name[name]): absent
+            for name, absent in scanned.get(file_path, {}).items()
+            if name in ids_by_name
+        }
+        set_day(ledger, date, statuses)
+    return ledger
+
+
+def rebuild_ledger(records_folder=RECORDS_FOLDER, workers=ARCHIVE_SCAN_WORKERS, progress=None):
+    """
+    يفحص أرشيف كل الصفوف دفعة واحدة عبر عدة عمليات ثم يوزع النتائج على الصفوف.
+    """
+    archive = {
+        (stage, department): list_class_archive(stage, department, records_folder)
+        for stage in STAGES
+        for department in DEPARTMENTS
+    }
+    all_files = [file_path for file_paths in archive.values() for file_path in file_paths]
+    scanned = scan_archive_files(all_files, workers=workers, progress=progress)
+
+    with _lock:
+        _ledgers.clear()
+        for (stage, department), file_paths in archive.items():
+            ledger = _ledger_from_scan(stage, department, file_paths, scanned)
+            save_data(get_ledger_file(stage, department), ledger)
+            _ledgers[(stage, department)] = ledger
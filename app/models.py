@@ -1,29 +1,102 @@
 from dataclasses import dataclass
-from typing import List, Dict
+
+# ==================================================
+# نماذج البيانات في الذاكرة
+# ==================================================
+#
+# ملفات JSON تبقى بنفس الشكل، والتحويل يتم عند التحميل والحفظ فقط.
+# نوع الحدث رقم صغير، والوقت عدد الدقائق منذ منتصف الليل.
+
+ARRIVAL = 0
+DEPARTURE = 1
+
+EVENT_TYPES = ("حضور", "انصراف")
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+
+def parse_time(text):
+    """
+    "08:01 AM" -> 481
+    """
+    clock, period = text.split()
+    hours, minutes = clock.split(":")
+    hours = int(hours) % 12
+    if period.upper() == "PM":
+        hours += 12
+    return hours * 60 + int(minutes)
+
+
+def format_time(minute):
+    """
+    481 -> "08:01 AM"
+    """
+    hours, minutes = divmod(minute, 60)
+    period = "PM" if hours >= 12 else "AM"
+    return f"{(hours % 12) or 12:02d}:{minutes:02d} {period}"
+
 
 @dataclass
 class Student:
+    __slots__ = ("id", "name", "stage", "department")
+
+    id: int
     name: str
     stage: str
     department: str
 
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["name"], data["stage"], data["department"])
 
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "stage": self.stage,
+            "department": self.department
+        }
 
-@dataclass
+
+@dataclass(frozen=True)
 class AttendanceEntry:
-    type: str        
-    time: str      
+    __slots__ = ("kind", "minute")
 
+    kind: int
+    minute: int
 
-@dataclass
-class DailyAttendance:
-    date: str
-    records: List[AttendanceEntry]
+    @classmethod
+    def from_dict(cls, data):
+        return cls(EVENT_CODES[data["type"]], parse_time(data["time"]))
 
+    def to_dict(self):
+        return {"type": EVENT_TYPES[self.kind], "time": format_time(self.minute)}
 
+    @property
+    def type_name(self):
+        return EVENT_TYPES[self.kind]
+
+    @property
+    def time_text(self):
+        return format_time(self.minute)
+
+
+# مفتاح محجوز في ملف حضور الصف: رقم آخر تصدير صُفّرت سجلاته من هذا الملف.
+# يُحفظ مع السجلات في نفس الكتابة، فيعرف استكمال التصدير هل تم التصفير أم لا.
+EXPORT_MARK_KEY = "_export"
+
+# مفتاح محجوز آخر: جيل السجل التراكمي. كل حفظ للملف يبدأ جيلًا جديدًا، وأسطر
+# السجل من جيل أقدم مدمجة (أو محذوفة عمدًا) فلا تُعاد عند التحميل.
+JOURNAL_GENERATION_KEY = "_journal"
 
-@dataclass
-class StudentAttendance:
-    student_key: str
-    days: Dict[str, List[AttendanceEntry]]
 
+def attendance_to_json(attendance):
+    """
+    {مفتاح: {تاريخ: [AttendanceEntry]}} -> {مفتاح: {تاريخ: [{"type", "time"}]}}
+    """
+    return {
+        student_key: {
+            date: [entry.to_dict() for entry in records]
+            for date, records in dates.items()
+        }
+        for student_key, dates in attendance.items()
+    }
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+
+from app.constants import (
+    STAGES,
+    DEPARTMENTS,
+    RECORDS_FOLDER,
+    REPORTS_FOLDER
+)
+from app.storage import load_stage_department_students
+from app.ledger import load_ledgers, ABSENT, PRESENT
+
+# ==================================================
+# تقرير الغياب لصف كامل أو للمدرسة كلها
+# ==================================================
+
+REPORT_COLUMNS = [
+    "ت", "اسم", "المرحلة", "القسم",
+    "أيام الغياب", "أيام الدوام", "نسبة الحضور"
+]
+
+
+def build_absence_report(classes=None, records_folder=RECORDS_FOLDER, progress=None):
+    """
+    classes: قائمة (مرحلة، قسم)، وإذا كانت None تشمل كل المراحل والأقسام.
+    يقرأ سجل الغياب لكل صف مرة واحدة ويحسب كل طلابه معًا.
+    """
+    if classes is None:
+        classes = [(stage, department) for stage in STAGES for department in DEPARTMENTS]
+
+    ledgers = load_ledgers(classes, records_folder, progress)
+    rows = []
+    for stage, department in classes:
+        marks_by_id = ledgers[(stage, department)]["students"]
+
+        for student in load_stage_department_students(stage, department):
+            marks = marks_by_id.get(str(student["id"]), "")
+            absent = marks.count(ABSENT)
+            total = absent + marks.count(PRESENT)
+            rows.append({
+                "name": student["name"],
+                "stage": stage,
+                "department": department,
+                "absent": absent,
+                "total": total,
+                "rate": (total - absent) / total if total else 1.0
+            })
+
+    rows.sort(key=lambda r: (-r["absent"], r["rate"], r["name"]))
+    return rows
+
+
+def export_absence_report(rows, file_name=None):
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
+
+    if file_name is None:
+        file_name = f"absence_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
+
+    os.makedirs(REPORTS_FOLDER, exist_ok=True)
+    file_path = os.path.join(REPORTS_FOLDER, file_name)
+
+    wb = Workbook()
+    ws = wb.active
+    ws.sheet_view.rightToLeft = True
+
+    ws.append(REPORT_COLUMNS)
+    for i, row in enumerate(rows, 1):
+        ws.append([
+            i,
+            row["name"],
+            row["stage"],
+            row["department"],
+            row["absent"],
+            row["total"],
+            f"{row['rate'] * 100:.1f}%"
+        ])
+
+    thin = Side(style="thin")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal="center", vertical="center")
+    header_fill = PatternFill("solid", start_color="D3D3D3")
+    header_font = Font(bold=True, size=14)
+    data_font = Font(size=12)
+
+    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, max_col=len(REPORT_COLUMNS)):
+        for cell in row:
+            cell.alignment = center
+            cell.border = border
+            if cell.row == 1:
+                cell.font = header_font
+                cell.fill = header_fill
+            else:
+                cell.font = data_font
+
+    for letter, width in zip("ABCDEFG", [5, 25, 15, 15, 12, 12, 12]):
+        ws.column_dimensions[letter].width = width
+
+    wb.save(file_path)
+    return file_path
@@ -0,0 +1,172 @@
+import heapq
+import re
+
+from app.storage import (
+    load_stage_department_students,
+    list_students,
+    get_class_version,
+    get_roster_version
+)
+
+# ==================================================
+# توحيد كتابة الأسماء العربية
+# ==================================================
+
+_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")
+_LETTER_FORMS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ؤ": "و", "ئ": "ي",
+    "ة": "ه",
+    "ى": "ي",
+})
+
+
+def normalize_name(name):
+    """
+    يحذف التشكيل والتطويل ويوحد أشكال الألف والهمزة والتاء المربوطة
+    والألف المقصورة، حتى يطابق "احمد" الاسم "أحمد".
+    """
+    name = _DIACRITICS.sub("", name.lower()).translate(_LETTER_FORMS)
+    return " ".join(name.split())
+
+
+# ==================================================
+# فهرس البحث عن الأسماء لكل مرحلة/قسم
+# ==================================================
+
+
+class ClassSearchIndex:
+    """
+    الأسماء مطبّعة مسبقًا، ولكل حرف قائمة الطلاب الذين تحتويه أسماؤهم.
+    أثناء الكتابة يكون الاستعلام الجديد امتدادًا للسابق، فنبحث داخل
+    نتائجه فقط بدل كل الصف.
+    """
+
+    def __init__(self, students):
+        self.students = students
+        self.names = [normalize_name(s["name"]) for s in students]
+        self.positions = {s["id"]: position for position, s in enumerate(students)}
+
+        self._by_char = {}
+        for position, name in enumerate(self.names):
+            for char in set(name):
+                self._by_char.setdefault(char, []).append(position)
+
+        self._last_query = ""
+        self._last_result = list(range(len(students)))
+
+    def search(self, text):
+        """
+        يعيد مواقع الطلاب المطابقين بنفس ترتيب الصف.
+        """
+        query = normalize_name(text)
+        if not query:
+            return list(range(len(self.students)))
+
+        if self._last_query and self._last_query in query:
+            candidates = self._last_result
+        else:
+            candidates = min(
+                (self._by_char.get(char, []) for char in set(query)),
+                key=len
+            )
+
+        names = self.names
+        result = [position for position in candidates if query in names[position]]
+
+        self._last_query = query
+        self._last_result = result
+        return result
+
+
+_indexes = {}
+
+
+def get_class_index(stage, department):
+    """
+    يعيد فهرس الصف من الذاكرة، ويعيد بناءه فقط إذا حُفظ الصف بعد بنائه.
+    """
+    version = get_class_version(stage, department)
+    cached = _indexes.get((stage, department))
+    if cached is None or cached[0] != version:
+        cached = (version, ClassSearchIndex(load_stage_department_students(stage, department)))
+        _indexes[(stage, department)] = cached
+    return cached[1]
+
+
+# ==================================================
+# البحث التقريبي في كل المدرسة (n-gram)
+# ==================================================
+
+NGRAM_SIZE = 3
+MIN_FUZZY_SCORE = 0.5
+
+
+def name_ngrams(name):
+    padded = f" {name} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class SchoolSearchIndex:
+    """
+    لكل مقطع من ثلاثة أحرف قائمة الطلاب الذين تحتويه أسماؤهم. الدرجة هي
+    نسبة مقاطع الاستعلام الموجودة في الاسم، والمطابقة الحرفية تأتي أولًا.
+    """
+
+    def __init__(self, students):
+        self.students = students
+        self.names = [normalize_name(s["name"]) for s in students]
+
+        self._by_ngram = {}
+        for position, name in enumerate(self.names):
+            for gram in name_ngrams(name):
+                self._by_ngram.setdefault(gram, []).append(position)
+
+    def search(self, text, stage=None, department=None, limit=50):
+        """
+        يعيد الطلاب المطابقين مرتبين من الأقرب، ويمكن حصر البحث في صف واحد.
+        """
+        query = normalize_name(text)
+        if not query:
+            return []
+
+        students = self.students
+        names = self.names
+
+        if len(query) < NGRAM_SIZE:
+            # الاستعلام أقصر من مقطع كامل داخل الاسم، فالمطابقة حرفية فقط
+            hits = {position: 0 for position, name in enumerate(names) if query in name}
+            min_count = 1
+        else:
+            query_grams = name_ngrams(query)
+            hits = {}
+            for gram in query_grams:
+                for position in self._by_ngram.get(gram, ()):
+                    hits[position] = hits.get(position, 0) + 1
+            min_count = MIN_FUZZY_SCORE * len(query_grams)
+
+        ranked = []
+        for position, count in hits.items():
+            student = students[position]
+            if stage is not None and student["stage"] != stage:
+                continue
+            if department is not None and student["department"] != department:
+                continue
+
+            name = names[position]
+            exact = query in name
+            if exact or count >= min_count:
+                ranked.append((not exact, -count, len(name), position))
+
+        return [students[item[-1]] for item in heapq.nsmallest(limit, ranked)]
+
+
+_school_index = None
+
+
+def get_school_index():
+    global _school_index
+    version = get_roster_version()
+    if _school_index is None or _school_index[0] != version:
+        _school_index = (version, SchoolSearchIndex(list_students()))
+    return _school_index[1]
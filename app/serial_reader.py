@@ -2,19 +2,38 @@ import serial
 import serial.tools.list_ports
 import time
 import threading
+from collections import deque, OrderedDict
+from dataclasses import dataclass
 
-from app.constants import BAUD_RATE
-from app.storage import load_data, save_data, CARDS_FILE
+from app.constants import (
+    BAUD_RATE,
+    SERIAL_READ_TIMEOUT,
+    READER_PORT_KEYWORDS,
+    READER_SCAN_INTERVAL,
+    GATE_NAMES,
+    CARD_QUEUE_SIZE,
+    CARD_QUEUE_PUT_TIMEOUT,
+    CARD_DEBOUNCE_SECONDS
+)
+from app.storage import load_cards, save_cards
 
 
 def normalize_uid(uid):
     return uid.strip().upper().replace(" ", "")
 
 
+def is_reader_port(port):
+    return any(keyword in port.description for keyword in READER_PORT_KEYWORDS)
+
+
+def detect_reader_ports():
+    return [port.device for port in serial.tools.list_ports.comports() if is_reader_port(port)]
+
+
 def auto_detect_port():
     ports = list(serial.tools.list_ports.comports())
     for port in ports:
-        if any(keyword in port.description for keyword in ["Arduino", "CH340", "USB Serial"]):
+        if is_reader_port(port):
             return port.device
 
     if ports:
@@ -22,15 +41,62 @@ def auto_detect_port():
 
     return None
 
+# ==================================================
+# قياس زمن الاستجابة
+# ==================================================
+
+class LatencyStats:
+    """
+    يحفظ آخر window قياس (بالثواني) من وصول السطر حتى انتهاء الاستدعاء.
+    """
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.max = max(self.max, seconds)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, worst = self.count, self.max
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": count,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "max_ms": worst * 1000
+        }
+
+
+# ==================================================
+# قارئ البطاقات
+# ==================================================
+
 class CardReader:
-    def __init__(self, selected_port, on_card_callback):
+    """
+    القراءة تنتظر أول بايت حتى SERIAL_READ_TIMEOUT بدل النوم بين الفحوص،
+    ثم تأخذ كل ما في المخزن دفعة واحدة وتمرر كل الأسطر المكتملة.
+    """
+
+    def __init__(self, selected_port, on_card_callback, on_error=None):
         self.selected_port = selected_port
         self.on_card_callback = on_card_callback
+        self.on_error = on_error
 
         self.card_mode_running = False
         self.reader_enabled = False
         self.card_thread = None
         self.ser = None
+        self.latency = LatencyStats()
 
     def start(self):
         if self.card_mode_running:
@@ -45,35 +111,283 @@ class CardReader:
         self.card_thread.start()
 
     def stop(self):
+        # العامل يغلق المنفذ بنفسه خلال SERIAL_READ_TIMEOUT
         self.reader_enabled = False
         self.card_mode_running = False
-        if self.ser and self.ser.is_open:
-            self.ser.close()
 
     def _card_mode_worker(self):
         try:
-            self.ser = serial.Serial(self.selected_port, BAUD_RATE, timeout=1)
-        except Exception:
-            self.stop()
+            self.ser = serial.Serial(self.selected_port, BAUD_RATE, timeout=SERIAL_READ_TIMEOUT)
+        except Exception as e:
+            self.card_mode_running = False
+            self._report_error("تعذر فتح منفذ البطاقة", e)
             return
 
-        while self.card_mode_running and self.reader_enabled:
-            try:
-                if self.ser.in_waiting:
-                    uid_line = self.ser.readline().decode("utf-8").strip()
-                    if uid_line:
-                        uid = normalize_uid(uid_line)
+        pending = b""
+        try:
+            while self.card_mode_running and self.reader_enabled:
+                chunk = self.ser.read(max(1, self.ser.in_waiting))
+                if not chunk:
+                    continue
+
+                received = time.perf_counter()
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    uid = normalize_uid(line.decode("utf-8", errors="ignore"))
+                    if uid:
                         self.on_card_callback(uid)
-                time.sleep(0.1)
-            except Exception:
+                        self.latency.add(time.perf_counter() - received)
+        except Exception as e:
+            if self.card_mode_running:
+                self._report_error("خطأ في قراءة البطاقة", e)
+        finally:
+            self.card_mode_running = False
+            if self.ser and self.ser.is_open:
+                self.ser.close()
+
+    def _report_error(self, message, error):
+        if self.on_error is not None:
+            self.on_error(message, error)
+
+
+# ==================================================
+# عدة قارئات (بوابات) في نفس الجهاز
+# ==================================================
+
+class CardDebouncer:
+    """
+    آخر وقت قُرئت فيه كل بطاقة، مرتبًا من الأقدم. كل قراءة تحذف من أول
+    الترتيب ما خرج من النافذة، ثم تنقل بطاقتها إلى آخره، فكل عملية O(1)
+    لكل بطاقة. القراءة المتكررة تمدد النافذة، فالبطاقة المثبتة على القارئ
+    لا تُحسب مرة ثانية حتى تُرفع.
+    """
+
+    def __init__(self, window=CARD_DEBOUNCE_SECONDS):
+        self.window = window
+        self.suppressed = 0
+        self._last_seen = OrderedDict()
+
+    def accept(self, uid, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        last_seen = self._last_seen
+        while last_seen:
+            oldest_uid, seen = next(iter(last_seen.items()))
+            if now - seen < self.window:
                 break
+            del last_seen[oldest_uid]
+
+        repeated = uid in last_seen
+        last_seen[uid] = now
+        last_seen.move_to_end(uid)
+
+        if repeated:
+            self.suppressed += 1
+            return False
+        return True
+
+
+@dataclass(frozen=True)
+class CardEvent:
+    __slots__ = ("seq", "gate", "uid", "received")
+
+    seq: int
+    gate: str
+    uid: str
+    received: float
+
+
+def gate_name(port):
+    return GATE_NAMES.get(port, port)
+
+
+class ReaderManager:
+    """
+    قارئ CardReader لكل منفذ، وكل القراءات تمر بـ on_event واحد بترتيب
+    وصولها مع رقم تسلسلي واسم البوابة. خيط الفحص يضيف القارئ عند توصيل
+    منفذه ويزيله عند فصله، فلا يقع أي فحص للمنافذ على خيط الواجهة.
+
+    ports: منافذ اختارها المستخدم يدويًا، تُفتح حتى لو لم تطابق
+    READER_PORT_KEYWORDS.
+    """
+
+    def __init__(self, on_event, on_error=None, ports=None):
+        self.on_event = on_event
+        self.on_error = on_error
+        self.fixed_ports = set(ports or ())
+        # مشترك بين البوابات، فنفس البطاقة على بوابتين متجاورتين تُحسب مرة
+        self.debouncer = CardDebouncer()
+
+        self.readers = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._seq_lock = threading.Lock()
+        self._seq = 0
+        self._running = False
+        self._wakeup = threading.Event()
+        self._scan_thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def gates(self):
+        with self._lock:
+            return [gate_name(port) for port, reader in self.readers.items() if reader.card_mode_running]
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._wakeup.clear()
+        self.scan()
+        self._scan_thread = threading.Thread(target=self._scan_worker, daemon=True)
+        self._scan_thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        with self._lock:
+            readers = list(self.readers.values())
+            self.readers.clear()
+        for reader in readers:
+            reader.stop()
+
+    def latency_summary(self):
+        with self._lock:
+            readers = dict(self.readers)
+        return {gate_name(port): reader.latency.summary() for port, reader in readers.items()}
+
+    def scan(self):
+        """
+        يطابق القارئات المفتوحة مع المنافذ الموصولة حاليًا.
+        """
+        present = {port.device: port for port in serial.tools.list_ports.comports()}
+        wanted = {
+            device for device, port in present.items()
+            if device in self.fixed_ports or is_reader_port(port)
+        }
+        # المنفذ الذي فشل يُعاد فتحه فقط بعد فصله وتوصيله من جديد
+        self._failed &= set(present)
+
+        with self._lock:
+            if not self._running:
+                return
+            for device, reader in list(self.readers.items()):
+                if device in wanted and reader.card_mode_running:
+                    continue
+                reader.stop()
+                del self.readers[device]
+                if device in wanted:
+                    self._failed.add(device)
+
+            for device in wanted - set(self.readers) - self._failed:
+                reader = CardReader(
+                    device,
+                    lambda uid, device=device: self._emit(device, uid),
+                    on_error=self._reader_error(device)
+                )
+                self.readers[device] = reader
+                reader.start()
+
+    def _scan_worker(self):
+        while not self._wakeup.wait(READER_SCAN_INTERVAL):
+            try:
+                self.scan()
+            except Exception as e:
+                self._report_error("تعذر فحص منافذ القارئات", e)
+
+    def _emit(self, device, uid):
+        # on_event قد ينتظر طابورًا ممتلئًا، فلا يُستدعى والقفل محجوز حتى
+        # لا تتوقف البوابات الأخرى ولا الفحص ولا stop()، والمستهلك يرتب بـ seq
+        with self._seq_lock:
+            if not self.debouncer.accept(uid):
+                return
+            self._seq += 1
+            event = CardEvent(self._seq, gate_name(device), uid, time.time())
+        self.on_event(event)
+
+    def _reader_error(self, device):
+        def report(message, error):
+            self._report_error(f"{message} ({gate_name(device)})", error)
+        return report
+
+    def _report_error(self, message, error):
+        if self.on_error is not None:
+            self.on_error(message, error)
+
+
+# ==================================================
+# طابور القراءات بين القارئات والواجهة
+# ==================================================
+
+class CardEventQueue:
+    """
+    طابور محدود تكتب فيه خيوط القارئات وتفرغه الواجهة دفعة واحدة.
+    إذا امتلأ ينتظر القارئ (فتبقى البايتات في مخزن المنفذ)، وإذا طال
+    الانتظار أكثر من put_timeout تُهمل القراءة وتُحسب في dropped.
+    """
+
+    def __init__(self, maxsize=CARD_QUEUE_SIZE, put_timeout=CARD_QUEUE_PUT_TIMEOUT):
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+
+        self._events = deque()
+        self._not_full = threading.Condition()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.waited = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.max_batch = 0
+
+    def __len__(self):
+        with self._not_full:
+            return len(self._events)
+
+    def put(self, event):
+        with self._not_full:
+            if len(self._events) >= self.maxsize:
+                self.waited += 1
+                if not self._not_full.wait_for(
+                    lambda: len(self._events) < self.maxsize, self.put_timeout
+                ):
+                    self.dropped += 1
+                    return False
+
+            self._events.append(event)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._events))
+            return True
+
+    def drain(self):
+        with self._not_full:
+            events = list(self._events)
+            self._events.clear()
+            if events:
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(events))
+                self._not_full.notify_all()
+            return events
+
+    def stats(self):
+        with self._not_full:
+            return {
+                "depth": len(self._events),
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "waited": self.waited,
+                "batches": self.batches,
+                "max_depth": self.max_depth,
+                "max_batch": self.max_batch
+            }
 
-        if self.ser and self.ser.is_open:
-            self.ser.close()
 
 def get_card_students():
-    return load_data(CARDS_FILE, {})
+    return load_cards()
 
 
 def save_card_students(card_students):
-    return save_data(CARDS_FILE, card_students)
+    return save_cards(card_students)
@@ -0,0 +1,365 @@
+import json
+import os
+import sqlite3
+import threading
+from tkinter import messagebox
+
+from app.constants import (
+    STAGES,
+    DEPARTMENTS,
+    DATABASE_FILE,
+    WRITE_DURABILITY,
+    STUDENTS_FOLDER,
+    ATTENDANCE_FOLDER,
+    CARDS_FILE,
+    STAGES_FILE
+)
+from app.models import EXPORT_MARK_KEY
+
+# ==================================================
+# تخزين SQLite بنفس واجهة app.storage
+# ==================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    department TEXT NOT NULL,
+    UNIQUE (stage, department, name)
+);
+
+CREATE TABLE IF NOT EXISTS cards (
+    uid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    department TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS card_students (
+    uid TEXT PRIMARY KEY,
+    student_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS attendance_events (
+    id INTEGER PRIMARY KEY,
+    student_key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    department TEXT NOT NULL,
+    date TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    time TEXT NOT NULL,
+    UNIQUE (student_key, date, seq)
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_class_date
+    ON attendance_events (stage, department, date);
+
+CREATE INDEX IF NOT EXISTS idx_events_date
+    ON attendance_events (date);
+"""
+
+_connection = None
+_lock = threading.RLock()
+
+
+def get_connection():
+    global _connection
+    with _lock:
+        if _connection is None:
+            folder = os.path.dirname(DATABASE_FILE)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+
+            _connection = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute(
+                "PRAGMA synchronous=FULL" if WRITE_DURABILITY == "full" else "PRAGMA synchronous=NORMAL"
+            )
+            _connection.executescript(SCHEMA)
+
+            if not _get_meta("json_migrated"):
+                migrate_from_json()
+        return _connection
+
+
+def _get_meta(key):
+    row = _connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(key, value):
+    _connection.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+def _write(statements):
+    """
+    ينفذ مجموعة أوامر داخل معاملة واحدة.
+    المعاملات على شكل list تعني عدة صفوف (executemany).
+    """
+    try:
+        with _lock:
+            conn = get_connection()
+            with conn:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        conn.executemany(sql, params)
+                    else:
+                        conn.execute(sql, params)
+        return True
+    except Exception as e:
+        messagebox.showerror("خطأ", f"فشل في حفظ البيانات:\n{str(e)}")
+        return False
+
+
+def _read(sql, params=()):
+    with _lock:
+        return get_connection().execute(sql, params).fetchall()
+
+
+# ==================================================
+# الطلاب
+# ==================================================
+
+def load_stage_department_students(stage, department):
+    rows = _read(
+        "SELECT id, name, stage, department FROM students "
+        "WHERE stage = ? AND department = ? ORDER BY id",
+        (stage, department)
+    )
+    return [{"id": i, "name": n, "stage": s, "department": d} for i, n, s, d in rows]
+
+
+def save_stage_department_students(stage, department, students):
+    """
+    جدول students هو سجل الأرقام: الطالب المنقول يحتفظ برقمه،
+    والطالب الجديد يأخذ رقمه من الجدول.
+    """
+    from app import storage
+
+    storage.bump_class_version(stage, department)
+    try:
+        with _lock:
+            conn = get_connection()
+            with conn:
+                conn.execute(
+                    "DELETE FROM students WHERE stage = ? AND department = ?",
+                    (stage, department)
+                )
+                for student in students:
+                    cursor = conn.execute(
+                        "INSERT OR REPLACE INTO students (id, name, stage, department) "
+                        "VALUES (?, ?, ?, ?)",
+                        (student.get("id"), student["name"], stage, department)
+                    )
+                    student["id"] = cursor.lastrowid
+        return True
+    except Exception as e:
+        messagebox.showerror("خطأ", f"فشل في حفظ البيانات:\n{str(e)}")
+        return False
+
+
+def list_students():
+    rows = _read(
+        "SELECT id, name, stage, department FROM students "
+        "ORDER BY stage, department, name"
+    )
+    return [{"id": i, "name": n, "stage": s, "department": d} for i, n, s, d in rows]
+
+
+def get_student(student_id):
+    rows = _read("SELECT id, name, stage, department FROM students WHERE id = ?", (student_id,))
+    if not rows:
+        return None
+    i, n, s, d = rows[0]
+    return {"id": i, "name": n, "stage": s, "department": d}
+
+
+# ==================================================
+# الحضور
+# ==================================================
+
+def load_stage_department_attendance(stage, department):
+    rows = _read(
+        "SELECT student_key, date, type, time FROM attendance_events "
+        "WHERE stage = ? AND department = ? ORDER BY id",
+        (stage, department)
+    )
+    attendance = {}
+    for student_key, date, op, time in rows:
+        attendance.setdefault(student_key, {}).setdefault(date, []).append(
+            {"type": op, "time": time}
+        )
+
+    export_mark = _read("SELECT value FROM meta WHERE key = ?", (_export_mark_key(stage, department),))
+    if export_mark:
+        attendance[EXPORT_MARK_KEY] = export_mark[0][0]
+    return attendance
+
+
+def save_stage_department_attendance(stage, department, attendance):
+    statements = [
+        ("DELETE FROM attendance_events WHERE stage = ? AND department = ?", (stage, department)),
+        # رقم الطالب ثابت عند النقل، فسجلاته قد تكون ما زالت محفوظة باسم صفه القديم
+        (
+            "DELETE FROM attendance_events WHERE student_key = ?",
+            [(str(student_key),) for student_key in attendance if student_key != EXPORT_MARK_KEY]
+        ),
+        (
+            "INSERT INTO attendance_events "
+            "(student_key, stage, department, date, seq, type, time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _attendance_rows(stage, department, attendance)
+        ),
+    ]
+    if EXPORT_MARK_KEY in attendance:
+        statements.append((
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (_export_mark_key(stage, department), attendance[EXPORT_MARK_KEY])
+        ))
+    return _write(statements)
+
+
+def _export_mark_key(stage, department):
+    return f"export_mark:{stage}|{department}"
+
+
+def append_attendance_event(stage, department, student_key, date, entry, seq):
+    return append_attendance_events(stage, department, [(student_key, date, entry, seq)])
+
+
+def append_attendance_events(stage, department, events):
+    return _write([(
+        "INSERT OR IGNORE INTO attendance_events "
+        "(student_key, stage, department, date, seq, type, time) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (student_key, stage, department, date, seq, entry["type"], entry["time"])
+            for student_key, date, entry, seq in events
+        ]
+    )])
+
+
+def get_attendance_journal_size(stage, department):
+    # كل حدث صف مستقل في الجدول، فلا يوجد سجل تراكمي يحتاج دمجًا
+    return 0
+
+
+def compact_stage_department_attendance(stage, department):
+    return load_stage_department_attendance(stage, department)
+
+
+def _attendance_rows(stage, department, attendance):
+    return [
+        (student_key, stage, department, date, seq, r["type"], r["time"])
+        for student_key, dates in attendance.items()
+        if student_key != EXPORT_MARK_KEY
+        for date, records in dates.items()
+        for seq, r in enumerate(records)
+    ]
+
+
+# ==================================================
+# البطاقات والمراحل
+# ==================================================
+
+def load_cards():
+    cards = {
+        uid: student_id
+        for uid, student_id in _read("SELECT uid, student_id FROM card_students")
+    }
+    # بطاقات قديمة مربوطة بالاسم، يحولها CardRegistry إلى أرقام
+    for uid, n, s, d in _read("SELECT uid, name, stage, department FROM cards"):
+        cards.setdefault(uid, {"name": n, "stage": s, "department": d})
+    return cards
+
+
+def save_cards(cards):
+    return _write([
+        ("DELETE FROM cards", ()),
+        ("DELETE FROM card_students", ()),
+        (
+            "INSERT INTO card_students (uid, student_id) VALUES (?, ?)",
+            list(cards.items())
+        ),
+    ])
+
+
+def load_stages():
+    with _lock:
+        get_connection()
+        value = _get_meta("stages")
+    return json.loads(value) if value else {}
+
+
+def save_stages(stages):
+    return _write([(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        ("stages", json.dumps(stages, ensure_ascii=False))
+    )])
+
+
+# ==================================================
+# الترحيل لمرة واحدة من ملفات JSON
+# ==================================================
+
+def migrate_from_json():
+    from app import storage
+
+    conn = _connection
+    with conn:
+        if os.path.exists(STUDENTS_FOLDER):
+            for file_name in sorted(os.listdir(STUDENTS_FOLDER)):
+                if not file_name.endswith(".json"):
+                    continue
+                students = storage.load_data(os.path.join(STUDENTS_FOLDER, file_name), [])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO students (id, name, stage, department) VALUES (?, ?, ?, ?)",
+                    [(s.get("id"), s["name"], s["stage"], s["department"]) for s in students]
+                )
+
+        for stage in STAGES:
+            for department in DEPARTMENTS:
+                path = storage.get_stage_department_path(stage, department)
+                attendance_file = os.path.join(ATTENDANCE_FOLDER, f"{path}.json")
+                if not storage.data_exists(attendance_file):
+                    continue
+                attendance = storage.load_data(attendance_file, {})
+                storage.replay_attendance_journal(
+                    attendance, storage.get_attendance_journal_file(stage, department)
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO attendance_events "
+                    "(student_key, stage, department, date, seq, type, time) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _attendance_rows(stage, department, attendance)
+                )
+
+        if os.path.exists(CARDS_FILE):
+            cards = storage.load_data(CARDS_FILE, {})
+            conn.executemany(
+                "INSERT OR REPLACE INTO cards (uid, name, stage, department) VALUES (?, ?, ?, ?)",
+                [
+                    (uid, c["name"], c["stage"], c["department"])
+                    for uid, c in cards.items() if isinstance(c, dict)
+                ]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO card_students (uid, student_id) VALUES (?, ?)",
+                [(uid, c) for uid, c in cards.items() if not isinstance(c, dict)]
+            )
+
+        if os.path.exists(STAGES_FILE):
+            stages = storage.load_data(STAGES_FILE, {})
+            if stages:
+                _set_meta("stages", json.dumps(stages, ensure_ascii=False))
+
+        _set_meta("json_migrated", "1")
@@ -1,15 +1,27 @@
+import atexit
 import json
 import os
+import shutil
+import threading
+from types import SimpleNamespace
 from tkinter import messagebox
 
 from app.constants import (
+    STAGES,
+    DEPARTMENTS,
     PROGRAM_STORAGE,
     STUDENTS_FOLDER,
     ATTENDANCE_FOLDER,
     CARDS_FILE,
     STAGES_FILE,
-    RECORDS_FOLDER
+    STUDENT_IDS_FILE,
+    RECORDS_FOLDER,
+    LEDGER_FOLDER,
+    STORAGE_BACKEND,
+    WRITE_DURABILITY,
+    FSYNC_BATCH_INTERVAL
 )
+from app.models import Student, JOURNAL_GENERATION_KEY
 
 
 def create_folders():
@@ -17,7 +29,8 @@ def create_folders():
         PROGRAM_STORAGE,
         STUDENTS_FOLDER,
         ATTENDANCE_FOLDER,
-        RECORDS_FOLDER
+        RECORDS_FOLDER,
+        LEDGER_FOLDER
     ]
     for folder in folders:
         if not os.path.exists(folder):
@@ -27,18 +40,18 @@ def create_folders():
 def load_data(filepath, default):
     if os.path.exists(filepath):
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return _read_json(filepath)
         except Exception:
-            return default
-    else:
-        
-        try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(default, f, ensure_ascii=False, indent=4)
-        except Exception:
-            pass
-        return default
+            return _recover_data(filepath, default)
+
+    if os.path.exists(filepath + BACKUP_SUFFIX):
+        return _recover_data(filepath, default)
+
+    try:
+        _write_json_atomic(filepath, default)
+    except Exception:
+        pass
+    return default
 
 
 def save_data(filepath, data):
@@ -47,38 +60,455 @@ def save_data(filepath, data):
         if folder and not os.path.exists(folder):
             os.makedirs(folder)
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        _write_json_atomic(filepath, data)
         return True
     except Exception as e:
         messagebox.showerror("خطأ", f"فشل في حفظ البيانات:\n{str(e)}")
         return False
 
 
+def data_exists(filepath):
+    return os.path.exists(filepath) or os.path.exists(filepath + BACKUP_SUFFIX)
+
+
+def delete_data(filepath):
+    # نحذف النسخة الاحتياطية أيضًا حتى لا يسترجعها load_data لاحقًا
+    for path in (filepath, filepath + BACKUP_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+            mark_written(path)
+
+
+# ==================================================
+# الكتابة الآمنة والاسترجاع
+# ==================================================
+
+BACKUP_SUFFIX = ".bak"
+
+_pending_sync = set()
+_sync_lock = threading.Lock()
+_sync_timer = None
+
+
+def _read_json(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json_atomic(filepath, data):
+    """
+    يكتب إلى ملف مؤقت ثم يستبدل الملف الأصلي دفعة واحدة،
+    ويحتفظ بالنسخة السابقة في filepath.bak.
+    """
+    tmp_file = filepath + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+        f.flush()
+        if WRITE_DURABILITY == "full":
+            os.fsync(f.fileno())
+
+    if os.path.exists(filepath):
+        _keep_backup(filepath)
+
+    os.replace(tmp_file, filepath)
+    mark_written(filepath)
+
+
+def _keep_backup(filepath):
+    backup_file = filepath + BACKUP_SUFFIX
+    if os.path.exists(backup_file):
+        os.remove(backup_file)
+    try:
+        os.link(filepath, backup_file)
+    except OSError:
+        shutil.copy2(filepath, backup_file)
+
+
+def _recover_data(filepath, default):
+    backup_file = filepath + BACKUP_SUFFIX
+
+    if os.path.exists(filepath):
+        # نحتفظ بالملف التالف للفحص بدل الكتابة فوقه
+        os.replace(filepath, filepath + ".corrupt")
+
+    try:
+        data = _read_json(backup_file)
+    except Exception:
+        print(f"تعذر قراءة {filepath} ولا توجد نسخة سليمة، تم استخدام القيمة الافتراضية")
+        return default
+
+    shutil.copy2(backup_file, filepath)
+    print(f"تم استرجاع {filepath} من النسخة الاحتياطية")
+    return data
+
+
+def mark_written(filepath):
+    """
+    في وضع full تمت المزامنة مسبقًا، وفي وضع batched تُجمع الملفات
+    وتُزامن معًا كل FSYNC_BATCH_INTERVAL ثانية.
+    """
+    global _sync_timer
+
+    if WRITE_DURABILITY == "full":
+        _fsync_folder(filepath)
+        return
+
+    with _sync_lock:
+        _pending_sync.add(filepath)
+        if _sync_timer is None:
+            _sync_timer = threading.Timer(FSYNC_BATCH_INTERVAL, sync_pending_writes)
+            _sync_timer.daemon = True
+            _sync_timer.start()
+
+
+def sync_pending_writes():
+    global _sync_timer
+
+    with _sync_lock:
+        paths = list(_pending_sync)
+        _pending_sync.clear()
+        _sync_timer = None
+
+    for filepath in paths:
+        try:
+            fd = os.open(filepath, os.O_RDWR)
+        except OSError:
+            # الملف حُذف بعد كتابته (مثل السجل التراكمي بعد الدمج)
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+        _fsync_folder(filepath)
+
+
+def _fsync_folder(filepath):
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def get_stage_department_path(stage, department):
     return f"{stage}_{department}"
 
 
-def load_stage_department_students(stage, department):
+def _json_load_stage_department_students(stage, department):
     path = get_stage_department_path(stage, department)
     class_file = os.path.join(STUDENTS_FOLDER, f"{path}.json")
-    return load_data(class_file, [])
+    students = load_data(class_file, [])
+    if _needs_student_ids(students) and _sync_student_ids(stage, department, students):
+        # ملف قديم بدون أرقام: نحفظ الأرقام الجديدة حتى تبقى ثابتة
+        save_data(class_file, students)
+    return students
 
-def save_stage_department_students(stage, department, students):
+def _json_save_stage_department_students(stage, department, students):
     path = get_stage_department_path(stage, department)
     class_file = os.path.join(STUDENTS_FOLDER, f"{path}.json")
+    _sync_student_ids(stage, department, students)
+    bump_class_version(stage, department)
     return save_data(class_file, students)
 
 
-def load_stage_department_attendance(stage, department):
+_class_versions = {}
+_roster_version = 0
+
+
+def get_class_version(stage, department):
+    """
+    رقم يزيد مع كل حفظ لقائمة الصف، لتعرف النسخ المخزنة في الذاكرة أنها قديمة.
+    """
+    return _class_versions.get((stage, department), 0)
+
+
+def get_roster_version():
+    # مثل get_class_version لكن لكل صفوف المدرسة معًا
+    return _roster_version
+
+
+def bump_class_version(stage, department):
+    global _roster_version
+    _class_versions[(stage, department)] = get_class_version(stage, department) + 1
+    _roster_version += 1
+
+
+# ==================================================
+# أرقام الطلاب الثابتة
+# ==================================================
+#
+# data/student_ids.json:
+#   {"next_id": 25, "complete": true, "students": {"7": ["اسم", "المرحلة", "القسم"], ...}}
+# الرقم لا يتغير عند النقل، والحضور والبطاقات وسجل الغياب مربوطة به.
+# كل حفظ لصف يحدّث السجل في مكانه، فهو أيضًا فهرس كل طلاب المدرسة.
+
+_registry = None
+_registry_lock = threading.RLock()
+
+
+def _load_registry():
+    global _registry
+    if _registry is None:
+        data = load_data(STUDENT_IDS_FILE, {"next_id": 1, "students": {}})
+        _registry = {
+            "next_id": data.get("next_id", 1),
+            "complete": data.get("complete", False),
+            "students": {
+                int(k): Student(int(k), *v) for k, v in data.get("students", {}).items()
+            }
+        }
+    return _registry
+
+
+def _save_registry(registry):
+    return save_data(STUDENT_IDS_FILE, {
+        "next_id": registry["next_id"],
+        "complete": registry["complete"],
+        "students": {
+            student_id: [s.name, s.stage, s.department]
+            for student_id, s in registry["students"].items()
+        }
+    })
+
+
+def _needs_student_ids(students):
+    with _registry_lock:
+        entries = _load_registry()["students"]
+        return any(s.get("id") not in entries for s in students)
+
+
+def _sync_student_ids(stage, department, students):
+    """
+    يعطي رقمًا لكل طالب ليس له رقم، ويسجل صف كل طالب.
+    يعيد True إذا أُضيفت أرقام جديدة إلى القائمة.
+    """
+    with _registry_lock:
+        registry = _load_registry()
+        entries = registry["students"]
+        assigned = False
+        changed = False
+        current = set()
+
+        for student in students:
+            student_id = student.get("id")
+            if student_id is None:
+                student_id = registry["next_id"]
+                student["id"] = student_id
+                assigned = True
+            registry["next_id"] = max(registry["next_id"], student_id + 1)
+
+            entry = Student(student_id, student["name"], stage, department)
+            if entries.get(student_id) != entry:
+                entries[student_id] = entry
+                changed = True
+            current.add(student_id)
+
+        # من نُقل إلى صف آخر سُجل هناك أولًا، فالباقي هنا طلاب محذوفون
+        removed = [
+            student_id for student_id, s in entries.items()
+            if s.stage == stage and s.department == department and student_id not in current
+        ]
+        for student_id in removed:
+            del entries[student_id]
+
+        if changed or removed:
+            _save_registry(registry)
+        return assigned
+
+
+def _json_get_student(student_id):
+    with _registry_lock:
+        entry = _load_registry()["students"].get(student_id)
+    if entry is None:
+        return None
+    return entry.to_dict()
+
+
+def _json_list_students():
+    """
+    كل طلاب المدرسة من السجل مباشرة، بدون تحميل ملفات الصفوف.
+    """
+    with _registry_lock:
+        registry = _load_registry()
+        if not registry["complete"]:
+            # مرة واحدة فقط: ملفات صفوف قديمة قد لا يكون لطلابها أرقام بعد
+            for stage in STAGES:
+                for department in DEPARTMENTS:
+                    load_stage_department_students(stage, department)
+            registry["complete"] = True
+            _save_registry(registry)
+        students = [s.to_dict() for s in registry["students"].values()]
+
+    stage_order = {stage: i for i, stage in enumerate(STAGES)}
+    department_order = {department: i for i, department in enumerate(DEPARTMENTS)}
+    students.sort(key=lambda s: (
+        stage_order.get(s["stage"], len(STAGES)),
+        department_order.get(s["department"], len(DEPARTMENTS)),
+        s["name"]
+    ))
+    return students
+
+
+def get_student_ids_by_name(stage, department):
+    return {s["name"]: s["id"] for s in load_stage_department_students(stage, department)}
+
+
+def get_attendance_journal_file(stage, department):
+    path = get_stage_department_path(stage, department)
+    return os.path.join(ATTENDANCE_FOLDER, f"{path}.journal")
+
+
+def _json_load_stage_department_attendance(stage, department):
     path = get_stage_department_path(stage, department)
     attendance_file = os.path.join(ATTENDANCE_FOLDER, f"{path}.json")
-    return load_data(attendance_file, {})
+    attendance = load_data(attendance_file, {})
+    _journal_generations[(stage, department)] = attendance.get(JOURNAL_GENERATION_KEY, 0)
+    replay_attendance_journal(attendance, get_attendance_journal_file(stage, department))
+    return attendance
 
-def save_stage_department_attendance(stage, department, attendance):
+def _json_save_stage_department_attendance(stage, department, attendance):
     path = get_stage_department_path(stage, department)
     attendance_file = os.path.join(ATTENDANCE_FOLDER, f"{path}.json")
-    return save_data(attendance_file, attendance)
+
+    # اللقطة قد تكون أقصر من السجل (تصدير أو نقل)، فجيل جديد يمنع إعادة أسطره
+    generation = _journal_generation(stage, department) + 1
+    attendance = dict(attendance)
+    attendance[JOURNAL_GENERATION_KEY] = generation
+    if not save_data(attendance_file, attendance):
+        return False
+    _journal_generations[(stage, department)] = generation
+
+    # اللقطة صارت تحتوي كل شيء، فالسجل التراكمي لم يعد لازمًا
+    journal_file = get_attendance_journal_file(stage, department)
+    try:
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+    except Exception:
+        pass
+    return True
+
+
+# ==================================================
+# السجل التراكمي (journal) لأحداث الحضور
+# ==================================================
+
+def _json_append_attendance_event(stage, department, student_key, date, entry, seq):
+    """
+    يضيف سطرًا واحدًا لكل حدث بدل إعادة كتابة ملف الصف كاملًا.
+    seq هو ترتيب الحدث داخل قائمة اليوم، ويمنع تكرار الحدث عند إعادة التشغيل.
+    """
+    return _json_append_attendance_events(stage, department, [(student_key, date, entry, seq)])
+
+
+def _json_append_attendance_events(stage, department, events):
+    """
+    events: [(مفتاح الطالب، التاريخ، الحدث، seq)]
+    كل الأحداث تُكتب بفتح واحد للملف ومزامنة واحدة.
+    """
+    journal_file = get_attendance_journal_file(stage, department)
+    generation = _journal_generation(stage, department)
+    lines = "".join(
+        json.dumps({
+            "key": student_key,
+            "date": date,
+            "type": entry["type"],
+            "time": entry["time"],
+            "seq": seq,
+            "gen": generation
+        }, ensure_ascii=False) + "\n"
+        for student_key, date, entry, seq in events
+    )
+
+    try:
+        with open(journal_file, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            if WRITE_DURABILITY == "full":
+                os.fsync(f.fileno())
+        mark_written(journal_file)
+        return True
+    except Exception as e:
+        messagebox.showerror("خطأ", f"فشل في حفظ البيانات:\n{str(e)}")
+        return False
+
+
+_journal_generations = {}
+
+
+def _journal_generation(stage, department):
+    class_id = (stage, department)
+    if class_id not in _journal_generations:
+        path = get_stage_department_path(stage, department)
+        attendance = load_data(os.path.join(ATTENDANCE_FOLDER, f"{path}.json"), {})
+        _journal_generations[class_id] = attendance.get(JOURNAL_GENERATION_KEY, 0)
+    return _journal_generations[class_id]
+
+
+def _json_get_attendance_journal_size(stage, department):
+    try:
+        return os.path.getsize(get_attendance_journal_file(stage, department))
+    except OSError:
+        return 0
+
+
+def replay_attendance_journal(attendance, journal_file):
+    generation = attendance.pop(JOURNAL_GENERATION_KEY, 0)
+    if not os.path.exists(journal_file):
+        return attendance
+
+    with open(journal_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # سطر ناقص بسبب انقطاع أثناء الكتابة
+                continue
+
+            # أسطر جيل أقدم من اللقطة صارت داخلها أو حُذفت منها عمدًا
+            if event.get("gen", 0) < generation:
+                continue
+
+            # مفاتيح ملف JSON نصية دائمًا
+            student_key = str(event["key"])
+            day_records = attendance.setdefault(student_key, {}).setdefault(event["date"], [])
+            if event["seq"] < len(day_records):
+                continue
+            day_records.append({"type": event["type"], "time": event["time"]})
+
+    return attendance
+
+
+def _json_compact_stage_department_attendance(stage, department):
+    attendance = _json_load_stage_department_attendance(stage, department)
+    if os.path.exists(get_attendance_journal_file(stage, department)):
+        _json_save_stage_department_attendance(stage, department, attendance)
+    return attendance
+
+
+def _json_load_cards():
+    return load_data(CARDS_FILE, {})
+
+def _json_save_cards(cards):
+    return save_data(CARDS_FILE, cards)
+
+
+def _json_load_stages():
+    return load_data(STAGES_FILE, {})
+
+def _json_save_stages(stages):
+    return save_data(STAGES_FILE, stages)
+
+
+atexit.register(sync_pending_writes)
 
 
 def initialize_storage():
@@ -90,3 +520,102 @@ def initialize_storage():
        
     load_data(STAGES_FILE, {})
 
+
+# ==================================================
+# اختيار نظام التخزين
+# ==================================================
+#
+# الدوال التالية هي الواجهة العامة، وكل منها يمرر الاستدعاء إلى نظام التخزين
+# الحالي. لذلك "from app.storage import ..." يبقى صحيحًا بعد use_backend().
+
+_json_backend = SimpleNamespace(
+    load_stage_department_students=_json_load_stage_department_students,
+    save_stage_department_students=_json_save_stage_department_students,
+    get_student=_json_get_student,
+    list_students=_json_list_students,
+    load_stage_department_attendance=_json_load_stage_department_attendance,
+    save_stage_department_attendance=_json_save_stage_department_attendance,
+    append_attendance_event=_json_append_attendance_event,
+    append_attendance_events=_json_append_attendance_events,
+    get_attendance_journal_size=_json_get_attendance_journal_size,
+    compact_stage_department_attendance=_json_compact_stage_department_attendance,
+    load_cards=_json_load_cards,
+    save_cards=_json_save_cards,
+    load_stages=_json_load_stages,
+    save_stages=_json_save_stages
+)
+_backend = None
+
+
+def use_backend(name):
+    """
+    name: "json" أو "sqlite"
+    """
+    global _backend
+    if name == "sqlite":
+        from app import sqlite_storage
+        _backend = sqlite_storage
+    else:
+        _backend = _json_backend
+
+
+def get_backend():
+    if _backend is None:
+        use_backend(STORAGE_BACKEND)
+    return _backend
+
+
+def load_stage_department_students(stage, department):
+    return get_backend().load_stage_department_students(stage, department)
+
+
+def save_stage_department_students(stage, department, students):
+    return get_backend().save_stage_department_students(stage, department, students)
+
+
+def get_student(student_id):
+    return get_backend().get_student(student_id)
+
+
+def list_students():
+    return get_backend().list_students()
+
+
+def load_stage_department_attendance(stage, department):
+    return get_backend().load_stage_department_attendance(stage, department)
+
+
+def save_stage_department_attendance(stage, department, attendance):
+    return get_backend().save_stage_department_attendance(stage, department, attendance)
+
+
+def append_attendance_event(stage, department, student_key, date, entry, seq):
+    return get_backend().append_attendance_event(stage, department, student_key, date, entry, seq)
+
+
+def append_attendance_events(stage, department, events):
+    return get_backend().append_attendance_events(stage, department, events)
+
+
+def get_attendance_journal_size(stage, department):
+    return get_backend().get_attendance_journal_size(stage, department)
+
+
+def compact_stage_department_attendance(stage, department):
+    return get_backend().compact_stage_department_attendance(stage, department)
+
+
+def load_cards():
+    return get_backend().load_cards()
+
+
+def save_cards(cards):
+    return get_backend().save_cards(cards)
+
+
+def load_stages():
+    return get_backend().load_stages()
+
+
+def save_stages(stages):
+    return get_backend().save_stages(stages)
@@ -1,5 +1,3 @@
-import os
-import time
 import threading
 import traceback
 from datetime import datetime
@@ -9,9 +7,6 @@ from tkinter import simpledialog, messagebox, ttk
 
 from PIL import Image, ImageTk
 
-import pandas as pd  
-
-import serial
 import serial.tools.list_ports
 
 from app.constants import (
@@ -22,26 +17,27 @@ from app.constants import (
     PROGRAM_STORAGE,
     STUDENTS_FOLDER,
     ATTENDANCE_FOLDER,
-    CARDS_FILE,
-    STAGES_FILE,
-    RECORDS_FOLDER,
-    BAUD_RATE,
+    CARD_DRAIN_INTERVAL_MS,
     WINDOW_WIDTH,
     WINDOW_HEIGHT,
 )
 
 from app.storage import (
     create_folders,
-    load_data,
-    save_data,
+    load_stages,
+    save_stages,
     get_stage_department_path,
+    get_student,
     load_stage_department_students,
     save_stage_department_students,
-    load_stage_department_attendance,
-    save_stage_department_attendance,
 )
 
-from app.export import export_data
+from app.attendance_store import attendance_store
+from app.cards import CardRegistry
+from app.serial_reader import ReaderManager, CardEventQueue, detect_reader_ports
+from app.models import ARRIVAL, DEPARTURE
+from app.search import get_class_index, get_school_index
+from app.logic import transfer_students
 
 
 
@@ -86,42 +82,38 @@ def ensure_default_fake_students(min_count_per_class: int = 10):
             save_stage_department_students(stage, department, students)
 
 
-def normalize_uid(uid: str) -> str:
-    return uid.strip().upper().replace(" ", "")
-
+# ==================================================
+# تحميل البيانات بعد ظهور النافذة
+# ==================================================
+#
+# استيراد هذا الملف لا يقرأ ولا يكتب أي ملف. التصدير وسجل الغياب
+# (openpyxl وعمليات الفحص) تُستورد عند أول استخدام فقط.
 
-def auto_detect_port():
-    ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        if any(keyword in port.description for keyword in ["Arduino", "CH340", "USB Serial"]):
-            return port.device
-    if ports:
-        return ports[0].device
-    return None
+stages_data = {}
+all_stage_departments = []
+card_registry = None
+data_ready = threading.Event()
 
 
+def load_startup_data():
+    global stages_data, all_stage_departments, card_registry
 
-create_folders()
+    create_folders()
 
-stages_data = load_data(STAGES_FILE, {})
-if not stages_data:
-    for st in STAGES:
-        stages_data[st] = list(DEPARTMENTS)
-    save_data(STAGES_FILE, stages_data)
+    stages_data = load_stages()
+    if not stages_data:
+        for st in STAGES:
+            stages_data[st] = list(DEPARTMENTS)
+        save_stages(stages_data)
 
-all_stage_departments = []
-for stg, deps in stages_data.items():
-    for dep in deps:
-        all_stage_departments.append(f"{stg} - {dep}")
+    all_stage_departments = [
+        f"{stg} - {dep}" for stg, deps in stages_data.items() for dep in deps
+    ]
 
-card_students = load_data(CARDS_FILE, {})
+    card_registry = CardRegistry()
 
-ensure_default_fake_students(min_count_per_class=10)
-
-all_students = []
-for st in STAGES:
-    for dep in DEPARTMENTS:
-        all_students.extend(load_stage_department_students(st, dep))
+    ensure_default_fake_students(min_count_per_class=10)
+    data_ready.set()
 
 
 
@@ -137,6 +129,7 @@ class AttendanceApp:
         master.option_add('*justify', 'center')
         master.option_add('*Text.direction', 'rtl')
         master.option_add('*Combobox*Listbox.justify', 'center')
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
 
         try:
             right_img = Image.open("Zaytoon_Vocational_Logo.png").resize((120, 120))
@@ -158,14 +151,15 @@ class AttendanceApp:
         except Exception:
             pass
 
-        self.card_mode_running = False
-        self.card_thread = None
-        self.selected_port = None
-        self.last_uid = None
+        self.reader_manager = None
+        self.reader_ports = []
+        self.card_queue = CardEventQueue()
+        self.processing_cards = False
         self.current_stage = tk.StringVar(value=STAGES[0] if STAGES else "")
         self.current_department = tk.StringVar(value=DEPARTMENTS[0] if DEPARTMENTS else "")
-        self.ser = None
         self.showing_records = False
+        self.records_class = None
+        self.records_items = {}
         self.reader_enabled = False
 
         title_label = tk.Label(
@@ -245,6 +239,7 @@ class AttendanceApp:
         )
         self.search_entry.grid(row=0, column=1, padx=3, pady=3)
         self.search_entry.bind("<Return>", lambda event: self.search_student())
+        self.search_entry.bind("<KeyRelease>", lambda event: self.search_student())
 
         button_style = {"font": ("Arial", 11), "relief": "raised", "bd": 1, "padx": 8, "pady": 3}
 
@@ -296,6 +291,11 @@ class AttendanceApp:
             command=self.move_students, bg="#e74c3c", fg="white"
         ).grid(row=0, column=2, padx=3, pady=3)
 
+        tk.Button(
+            extra_buttons_frame, text="تصدير كامل ♻️", **button_style,
+            command=lambda: self.export_data(force=True), bg="#a04000", fg="white"
+        ).grid(row=0, column=3, padx=3, pady=3)
+
         self.display_frame = tk.Frame(center_frame, bg="white")
         self.display_frame.pack(fill="both", expand=True, pady=10, padx=15)
 
@@ -303,9 +303,34 @@ class AttendanceApp:
         self.create_records_tree()
 
         self.current_matches = []
-        self.search_student()
+        self._listed_index = None
+        self._listed_positions = []
         self.show_student_list()
 
+        threading.Thread(target=self.load_data_thread, daemon=True).start()
+        self.master.after(CARD_DRAIN_INTERVAL_MS, self.drain_card_queue)
+
+    def load_data_thread(self):
+        try:
+            load_startup_data()
+        except Exception as e:
+            # e يُحذف بعد نهاية except، فالرسالة تُبنى قبل تأجيل عرضها
+            message = f"فشل في تحميل البيانات:\n{str(e)}"
+            self.master.after(0, lambda: messagebox.showerror("❌ خطأ", message))
+            print(traceback.format_exc())
+            return
+        self.master.after(0, self.on_data_loaded)
+
+    def on_data_loaded(self):
+        self.search_student()
+        if self.showing_records:
+            self.update_records_display()
+
+    def on_close(self):
+        self.stop_card_mode()
+        attendance_store.close()
+        self.master.destroy()
+
     def update_clock(self):
         current_time = datetime.now().strftime("%I:%M:%S %p")
         self.clock_label.config(text=current_time)
@@ -380,40 +405,67 @@ class AttendanceApp:
         self.tree_frame.pack(fill="both", expand=True)
         self.update_records_display()
 
-    def update_records_display(self):
-        for item in self.records_tree.get_children():
-            self.records_tree.delete(item)
-
-        selected_stage = self.current_stage.get()
-        selected_department = self.current_department.get()
-        stage_department_attendance = load_stage_department_attendance(selected_stage, selected_department)
-
-        for student_key, dates in stage_department_attendance.items():
-            name, stage, department = student_key.split("|")
-            for date, records in dates.items():
-                attendance_times = [rec['time'] for rec in records if rec['type'] == 'حضور']
-                departure_times = [rec['time'] for rec in records if rec['type'] == 'انصراف']
+    def update_records_display(self, students=None):
+        """
+        students: الطلاب الذين سُجل لهم حدث للتو، فتُحدّث صفوفهم فقط.
+        بدونها (أو عند تغير الصف المعروض) يُعاد بناء الجدول كاملًا.
+        """
+        if not data_ready.is_set():
+            return
 
-                attendance_str = "\n".join(attendance_times) if attendance_times else "غياب"
-                departure_str = "\n".join(departure_times) if departure_times else "لم ينصرف"
+        class_id = (self.current_stage.get(), self.current_department.get())
+        if students is None or class_id != self.records_class:
+            self.rebuild_records_display(class_id)
+            return
 
-                self.records_tree.insert(
-                    "", "end",
-                    values=(departure_str, attendance_str, date, department, stage, name)
+        # نسخ تحت قفل المخزن، فخيط التصدير قد يحذف مفاتيح أثناء العرض
+        for student in students:
+            if (student["stage"], student["department"]) == class_id:
+                self.set_student_record_rows(
+                    student, attendance_store.snapshot_student(*class_id, student["id"])
                 )
 
+    def rebuild_records_display(self, class_id):
+        self.records_tree.delete(*self.records_tree.get_children())
+        self.records_items = {}
+        self.records_class = class_id
+
+        for student_id, dates in attendance_store.snapshot(*class_id).items():
+            student = get_student(student_id)
+            if student is not None:
+                self.set_student_record_rows(student, dates)
+
+    def set_student_record_rows(self, student, dates):
+        """
+        records_items: {(رقم الطالب، التاريخ): عنصر الجدول}
+        """
+        name, stage, department = student['name'], student['stage'], student['department']
+        for date, records in dates.items():
+            attendance_times = [rec.time_text for rec in records if rec.kind == ARRIVAL]
+            departure_times = [rec.time_text for rec in records if rec.kind == DEPARTURE]
+
+            attendance_str = "\n".join(attendance_times) if attendance_times else "غياب"
+            departure_str = "\n".join(departure_times) if departure_times else "لم ينصرف"
+            values = (departure_str, attendance_str, date, department, stage, name)
+
+            item = self.records_items.get((student["id"], date))
+            if item is None:
+                self.records_items[(student["id"], date)] = self.records_tree.insert("", "end", values=values)
+            else:
+                self.records_tree.item(item, values=values)
+
     def toggle_reader(self):
         if not self.reader_enabled:
-            auto_port = auto_detect_port()
-            if auto_port is None:
+            auto_ports = detect_reader_ports()
+            if not auto_ports:
                 messagebox.showerror("❌ خطأ", "لم يتم التعرف على جهاز الاردوينو تلقائيًا.\nيرجى اختيار المنفذ يدويًا.")
                 chosen_port = self.choose_serial_port()
                 if not chosen_port:
                     return
-                self.selected_port = chosen_port
+                self.reader_ports = [chosen_port]
             else:
-                self.selected_port = auto_port
-                messagebox.showinfo("✅ نجح", f"تم التعرف على جهاز الاردوينو تلقائيًا على المنفذ {auto_port}")
+                self.reader_ports = []
+                messagebox.showinfo("✅ نجح", f"تم التعرف على جهاز الاردوينو تلقائيًا على المنافذ: {'، '.join(auto_ports)}")
 
             self.reader_enabled = True
             self.reader_btn.config(text="إطفاء القارئ ⏹️", bg="#e74c3c")
@@ -427,15 +479,40 @@ class AttendanceApp:
             messagebox.showinfo("✅ نجح", "تم إيقاف القارئ بنجاح")
 
     def start_card_mode(self):
-        if not self.card_mode_running:
-            self.card_mode_running = True
-            self.card_thread = threading.Thread(target=self.card_mode_worker, daemon=True)
-            self.card_thread.start()
+        if self.reader_manager and self.reader_manager.running:
+            return
+        # كل البوابات تصب في نفس الاستدعاء، والمنافذ الجديدة تُضاف تلقائيًا
+        self.reader_manager = ReaderManager(
+            self.card_queue.put,
+            on_error=self.on_reader_error,
+            ports=self.reader_ports
+        )
+        self.reader_manager.start()
 
     def stop_card_mode(self):
-        self.card_mode_running = False
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.reader_manager is None:
+            return
+        latency = self.reader_manager.latency_summary()
+        self.reader_manager.stop()
+        for gate, stats in latency.items():
+            if stats["count"]:
+                print(
+                    f"زمن القراءة ({gate}): {stats['count']} بطاقة، المتوسط {stats['mean_ms']:.2f}ms، "
+                    f"p99 {stats['p99_ms']:.2f}ms، الأقصى {stats['max_ms']:.2f}ms"
+                )
+        suppressed = self.reader_manager.debouncer.suppressed
+        if suppressed:
+            print(f"قراءات مكررة تم تجاهلها: {suppressed}")
+        stats = self.card_queue.stats()
+        if stats["enqueued"]:
+            print(
+                f"طابور البطاقات: {stats['enqueued']} قراءة في {stats['batches']} دفعة، "
+                f"أكبر دفعة {stats['max_batch']}، أقصى انتظار {stats['max_depth']}، "
+                f"انتظر القارئ {stats['waited']} مرة، أُهملت {stats['dropped']}"
+            )
+
+    def on_reader_error(self, message, error):
+        self.master.after(0, lambda: messagebox.showerror("❌ خطأ", f"{message}:\n{error}"))
 
     def choose_serial_port(self):
         ports = list(serial.tools.list_ports.comports())
@@ -484,29 +561,6 @@ class AttendanceApp:
         self.master.wait_window(port_window)
         return selected.get('port')
 
-    def card_mode_worker(self):
-        try:
-            self.ser = serial.Serial(self.selected_port, BAUD_RATE, timeout=1)
-        except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("❌ خطأ", f"تعذر فتح منفذ البطاقة:\n{e}"))
-            self.stop_card_mode()
-            return
-
-        while self.card_mode_running and self.reader_enabled:
-            try:
-                if self.ser.in_waiting:
-                    uid_line = self.ser.readline().decode("utf-8").strip()
-                    if uid_line:
-                        uid = normalize_uid(uid_line)
-                        self.master.after(0, self.process_card, uid)
-                time.sleep(0.1)
-            except Exception as e:
-                self.master.after(0, lambda: messagebox.showerror("❌ خطأ", f"خطأ في قراءة البطاقة:\n{e}"))
-                break
-
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-
     def on_stage_selected(self, event):
         self.search_student()
         if self.showing_records:
@@ -587,30 +641,68 @@ class AttendanceApp:
                   relief="raised", bd=1).pack(side="left", padx=3)
 
     def search_student(self):
-        search_text = self.search_entry.get().strip()
-        self.student_listbox.delete(0, tk.END)
+        if not data_ready.is_set():
+            self.student_listbox.delete(0, tk.END)
+            self.student_listbox.insert(tk.END, "جارٍ تحميل البيانات...")
+            return
 
-        stage_department_students = load_stage_department_students(
-            self.current_stage.get(),
-            self.current_department.get()
-        )
+        stage = self.current_stage.get()
+        department = self.current_department.get()
+        search_text = self.search_entry.get()
 
-        if not search_text:
-            self.current_matches = stage_department_students
-            for idx, student in enumerate(stage_department_students, 1):
-                self.student_listbox.insert(tk.END, f"{student['name']} - {idx}")
-            return
+        index = get_class_index(stage, department)
+        positions = index.search(search_text)
+
+        ranked = False
+        if not positions and search_text.strip():
+            # لا توجد مطابقة حرفية: نعرض أقرب الأسماء في الصف مرتبة
+            matches = get_school_index().search(search_text, stage, department)
+            positions = [index.positions[s["id"]] for s in matches if s["id"] in index.positions]
+            ranked = True
+
+        self.current_matches = [index.students[p] for p in positions]
+        self.update_student_listbox(index, positions, ranked)
+
+    def update_student_listbox(self, index, positions, ranked=False):
+        """
+        يحدّث القائمة بحذف وإضافة الصفوف المتغيرة فقط. الرقم بجانب الاسم
+        هو ترتيب الطالب في الصف، فلا يتغير أثناء التصفية.
+        ranked: النتائج مرتبة حسب القرب وليس حسب الصف، فتُعاد كتابة القائمة.
+        """
+        listbox = self.student_listbox
 
-        self.current_matches = [
-            s for s in stage_department_students
-            if search_text.lower() in s["name"].lower()
-        ]
+        def label(position):
+            return f"{index.students[position]['name']} - {position + 1}"
 
-        if not self.current_matches:
-            self.student_listbox.insert(tk.END, "لا يوجد طالب بهذا الاسم في هذه المرحلة والقسم.")
+        old = self._listed_positions
+        if index is not self._listed_index or ranked or not old or not positions:
+            listbox.delete(0, tk.END)
+            if positions:
+                listbox.insert(tk.END, *[label(p) for p in positions])
+            elif index.students:
+                listbox.insert(tk.END, "لا يوجد طالب بهذا الاسم في هذه المرحلة والقسم.")
         else:
-            for idx, student in enumerate(self.current_matches, 1):
-                self.student_listbox.insert(tk.END, f"{student['name']} - {idx}")
+            # القائمتان بترتيب الصف، فنمشي عليهما معًا
+            row = i = j = 0
+            while i < len(old) or j < len(positions):
+                if j == len(positions) or (i < len(old) and old[i] < positions[j]):
+                    start = i
+                    while i < len(old) and (j == len(positions) or old[i] < positions[j]):
+                        i += 1
+                    listbox.delete(row, row + i - start - 1)
+                elif i == len(old) or positions[j] < old[i]:
+                    start = j
+                    while j < len(positions) and (i == len(old) or positions[j] < old[i]):
+                        j += 1
+                    listbox.insert(row, *[label(p) for p in positions[start:j]])
+                    row += j - start
+                else:
+                    row += 1
+                    i += 1
+                    j += 1
+
+        self._listed_index = None if ranked else index
+        self._listed_positions = positions
 
     def add_student(self):
         add_window = tk.Toplevel(self.master)
@@ -666,12 +758,6 @@ class AttendanceApp:
             stage_department_students.sort(key=lambda x: x["name"])
 
             if save_stage_department_students(stage, department, stage_department_students):
-                global all_students
-                all_students = []
-                for stg in STAGES:
-                    for dept in DEPARTMENTS:
-                        all_students.extend(load_stage_department_students(stg, dept))
-
                 messagebox.showinfo("✅ نجح", f"تم إضافة الطالب {name} بنجاح")
                 add_window.destroy()
                 self.search_student()
@@ -707,10 +793,10 @@ class AttendanceApp:
             messagebox.showwarning("⚠️ تنبيه", "يرجى إدخال اسم الطالب.")
             return
 
-        stage_department_students = load_stage_department_students(
+        stage_department_students = get_class_index(
             self.current_stage.get(),
             self.current_department.get()
-        )
+        ).students
         matches = [s for s in stage_department_students if search_text.lower() == s["name"].lower()]
 
         if not matches:
@@ -726,39 +812,19 @@ class AttendanceApp:
         self.search_entry.delete(0, tk.END)
 
     def record_attendance(self, student, operation=None):
-        stage_department_attendance = load_stage_department_attendance(student["stage"], student["department"])
-
-        student_key = f"{student['name']}|{student['stage']}|{student['department']}"
-        current_time = datetime.now().strftime("%I:%M %p")
-        current_date = datetime.now().strftime("%Y-%m-%d")
-
-        if student_key not in stage_department_attendance:
-            stage_department_attendance[student_key] = {}
-
-        if current_date not in stage_department_attendance[student_key]:
-            stage_department_attendance[student_key][current_date] = []
-
-        if operation is None:
-            if not stage_department_attendance[student_key][current_date]:
-                op = "حضور"
-            else:
-                last_action = stage_department_attendance[student_key][current_date][-1]['type']
-                op = "انصراف" if last_action == "حضور" else "حضور"
-        else:
-            op = operation
-
-        stage_department_attendance[student_key][current_date].append({'type': op, 'time': current_time})
+        attendance_store.record(student, operation)
+        if self.showing_records:
+            self.update_records_display([student])
 
-        if save_stage_department_attendance(student["stage"], student["department"], stage_department_attendance):
-            if self.showing_records:
-                self.update_records_display()
+    def export_data(self, force=False):
+        threading.Thread(target=self.export_data_thread, args=(force,), daemon=True).start()
 
-    def export_data(self):
-        threading.Thread(target=self.export_data_thread, daemon=True).start()
+    def export_data_thread(self, force=False):
+        from app.export import export_data
 
-    def export_data_thread(self):
         try:
-            export_data()
+            data_ready.wait()
+            export_data(force=force)
             self.master.after(0, self.stop_card_mode)
             if self.showing_records:
                 self.master.after(0, self.update_records_display)
@@ -826,28 +892,28 @@ class AttendanceApp:
         scrollbar = tk.Scrollbar(listbox_frame, orient="vertical", command=listbox.yview)
         listbox.configure(yscrollcommand=scrollbar.set)
 
-        global all_students
-        all_students = []
-        for stg in STAGES:
-            for dept in DEPARTMENTS:
-                all_students.extend(load_stage_department_students(stg, dept))
+        school_index = get_school_index()
+        shown = []
+
+        def show_students(students):
+            shown[:] = students
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *[
+                f"{student['name']} ({student['stage']} - {student['department']})"
+                for student in students
+            ])
 
-        for student in all_students:
-            listbox.insert(tk.END, f"{student['name']} ({student['stage']} - {student['department']})")
+        show_students(school_index.students)
 
         listbox.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
         def search_students_key(*args):
-            search_text = search_entry.get().strip().lower()
-            listbox.delete(0, tk.END)
+            search_text = search_entry.get().strip()
             if not search_text:
-                for student in all_students:
-                    listbox.insert(tk.END, f"{student['name']} ({student['stage']} - {student['department']})")
+                show_students(school_index.students)
                 return
-            for student in all_students:
-                if search_text in student['name'].lower():
-                    listbox.insert(tk.END, f"{student['name']} ({student['stage']} - {student['department']})")
+            show_students(school_index.search(search_text))
 
         search_entry.bind("<KeyRelease>", search_students_key)
 
@@ -856,11 +922,7 @@ class AttendanceApp:
         def select_name():
             selection = listbox.curselection()
             if selection:
-                selected_text = listbox.get(selection[0])
-                name = selected_text.split(" (")[0]
-                stage_dept = selected_text.split(" (")[1].replace(")", "")
-                stage, department = stage_dept.split(" - ")
-                result['student'] = {"name": name, "stage": stage, "department": department}
+                result['student'] = shown[selection[0]]
                 select_window.destroy()
             else:
                 messagebox.showwarning("⚠️ تنبيه", "يرجى اختيار اسم.")
@@ -949,11 +1011,46 @@ class AttendanceApp:
         self.master.wait_window(new_window)
         return result.get('student')
 
-    def process_card(self, uid):
-        global card_students
+    def drain_card_queue(self):
+        # الرسائل المنبثقة في process_card تشغل حلقة Tk، فلا نبدأ دفعة داخل أخرى
+        if data_ready.is_set() and not self.processing_cards:
+            events = self.card_queue.drain()
+            if events:
+                self.processing_cards = True
+                try:
+                    # قراءات بوابتين في نفس اللحظة قد تصل الطابور بغير ترتيبها
+                    events.sort(key=lambda event: event.seq)
+                    self.process_cards([event.uid for event in events])
+                finally:
+                    self.processing_cards = False
+        self.master.after(CARD_DRAIN_INTERVAL_MS, self.drain_card_queue)
+
+    def process_cards(self, uids):
+        """
+        البطاقات المسجلة تُحفظ بكتابة واحدة وتحديث واحد للعرض،
+        ثم تُعرض البطاقات غير المسجلة واحدة واحدة.
+        """
+        students = []
+        unknown = []
+        for uid in uids:
+            student = card_registry.lookup(uid)
+            if student is None:
+                unknown.append(uid)
+            else:
+                students.append(student)
+
+        if students:
+            attendance_store.record_many(students)
+            if self.showing_records:
+                self.update_records_display(students)
+
+        for uid in unknown:
+            self.process_card(uid)
 
-        if uid in card_students:
-            student_data = card_students[uid]
+    def process_card(self, uid):
+        data_ready.wait()
+        student_data = card_registry.lookup(uid)
+        if student_data is not None:
             self.record_attendance(student_data)
             return
 
@@ -972,33 +1069,43 @@ class AttendanceApp:
         else:
             return
 
-        card_students[uid] = student
-        if save_data(CARDS_FILE, card_students):
-            found = False
-            stage_department_students = load_stage_department_students(student["stage"], student["department"])
-            for s in stage_department_students:
-                if s["name"] == student["name"]:
-                    found = True
-                    break
-
-            if not found:
-                stage_department_students.append(student)
-                stage_department_students.sort(key=lambda x: x["name"])
-                save_stage_department_students(student["stage"], student["department"], stage_department_students)
-
-                global all_students
-                all_students = []
-                for stg in STAGES:
-                    for dept in DEPARTMENTS:
-                        all_students.extend(load_stage_department_students(stg, dept))
+        stage_department_students = load_stage_department_students(student["stage"], student["department"])
+        found = None
+        for s in stage_department_students:
+            if s["name"] == student["name"]:
+                found = s
+                break
+
+        if found is None:
+            # الحفظ يعطي الطالب الجديد رقمه الثابت
+            stage_department_students.append(student)
+            stage_department_students.sort(key=lambda x: x["name"])
+            if not save_stage_department_students(student["stage"], student["department"], stage_department_students):
+                return
+        else:
+            student = found
+
+        replace = False
+        if card_registry.has_card(student):
+            old_uids = "، ".join(card_registry.uids_for(student))
+            answer = messagebox.askyesnocancel(
+                "❓ بطاقة مسجلة مسبقًا",
+                f"الطالب {student['name']} لديه بطاقة مسجلة ({old_uids}).\n"
+                "نعم: استبدالها بالبطاقة الجديدة\nلا: إضافة البطاقة الجديدة مع إبقاء القديمة"
+            )
+            if answer is None:
+                return
+            replace = answer
 
+        card_registry.bind(uid, student, replace=replace)
+        if card_registry.save():
             messagebox.showinfo("✅ نجح", f"تم ربط البطاقة بالطالب {student['name']} بنجاح")
             self.record_attendance(student)
 
     def search_absence_days(self):
         absence_window = tk.Toplevel(self.master)
         absence_window.title("البحث عن أيام الغياب")
-        absence_window.geometry("450x250")
+        absence_window.geometry("450x300")
         absence_window.configure(bg="white")
         absence_window.option_add('*Font', 'Arial 10')
         absence_window.option_add('*justify', 'center')
@@ -1052,6 +1159,29 @@ class AttendanceApp:
         )
         search_btn.pack(pady=8)
 
+        report_frame = tk.Frame(absence_window, bg="white")
+        report_frame.pack(pady=3)
+
+        tk.Button(
+            report_frame, text="تقرير الصف 📑", font=("Arial", 10),
+            command=lambda: threading.Thread(
+                target=self.generate_absence_report,
+                args=([(stage_var.get(), department_var.get())],),
+                daemon=True
+            ).start(),
+            bg="#2980b9", fg="white", relief="raised", bd=1
+        ).pack(side="left", padx=3)
+
+        tk.Button(
+            report_frame, text="تقرير المدرسة 🏫", font=("Arial", 10),
+            command=lambda: threading.Thread(
+                target=self.generate_absence_report,
+                args=(None,),
+                daemon=True
+            ).start(),
+            bg="#2980b9", fg="white", relief="raised", bd=1
+        ).pack(side="left", padx=3)
+
         self.progress_label = tk.Label(absence_window, text="", font=("Arial", 10),
                                        fg="#2c3e50", bg="white")
         self.progress_label.pack(pady=3)
@@ -1073,37 +1203,49 @@ class AttendanceApp:
             return
 
         student = matches[0]
-        class_folder = os.path.join(RECORDS_FOLDER, stage, department)
+        self.master.after(0, lambda: self.progress_label.config(text="جارٍ البحث في سجل الغياب"))
 
-        if not os.path.exists(class_folder):
-            self.master.after(0, lambda: messagebox.showinfo("⚠️ تنبيه", "لا توجد سجلات لهذه المرحلة والقسم."))
-            return
+        from app.ledger import get_student_absence
 
-        excel_files = [f for f in os.listdir(class_folder) if f.endswith('.xlsx')]
-        total_files = len(excel_files)
+        absence_count, total_files = get_student_absence(
+            student, progress=self.report_archive_progress
+        )
 
         if total_files == 0:
+            self.master.after(0, lambda: self.progress_label.config(text=""))
             self.master.after(0, lambda: messagebox.showinfo("⚠️ تنبيه", "لا توجد سجلات لهذه المرحلة والقسم."))
             return
 
-        absence_count = 0
+        self.master.after(0, lambda: self.progress_label.config(text="اكتمل البحث"))
+        result_text = f"عدد أيام الغياب للطالب {student['name']}: {absence_count} من أصل {total_files} يوم"
+        self.master.after(0, lambda: self.result_label.config(text=result_text))
 
-        for i, file_name in enumerate(excel_files):
-            file_path = os.path.join(class_folder, file_name)
-            self.master.after(0, lambda i=i: self.progress_label.config(text=f"جارٍ البحث في الملف {i+1}/{total_files}"))
+    def report_archive_progress(self, done, total):
+        self.master.after(
+            0, lambda: self.progress_label.config(text=f"جارٍ البحث في الملف {done}/{total}")
+        )
 
-            try:
-                df = pd.read_excel(file_path)
-                student_row = df[df['اسم'] == student['name']]
-                if not student_row.empty:
-                    attendance_status = student_row['الحضور'].values[0]
-                    if attendance_status == "غياب":
-                        absence_count += 1
-            except Exception:
-                pass
+    def generate_absence_report(self, classes):
+        self.master.after(0, lambda: self.progress_label.config(text="جارٍ إعداد تقرير الغياب"))
+        try:
+            from app.reports import build_absence_report, export_absence_report
 
-        self.master.after(0, lambda: self.progress_label.config(text="اكتمل البحث"))
-        result_text = f"عدد أيام الغياب للطالب {student['name']}: {absence_count} من أصل {total_files} يوم"
+
+            rows = build_absence_report(classes, progress=self.report_archive_progress)
+            if classes is None:
+                file_name = f"absence_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
+            else:
+                stage, department = classes[0]
+                file_name = f"absence_{stage}_{department}_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
+            file_path = export_absence_report(rows, file_name)
+        except Exception as e:
+            message = f"فشل في إعداد التقرير:\n{str(e)}"
+            self.master.after(0, lambda: messagebox.showerror("❌ خطأ", message))
+            print(traceback.format_exc())
+            return
+
+        self.master.after(0, lambda: self.progress_label.config(text="اكتمل التقرير"))
+        result_text = f"تم حفظ تقرير {len(rows)} طالب في:\n{file_path}"
         self.master.after(0, lambda: self.result_label.config(text=result_text))
 
     def move_students(self):
@@ -1208,8 +1350,6 @@ class AttendanceApp:
         load_students_ui()
 
         def move_selected_students():
-            global card_students
-
             source_stage = source_stage_var.get()
             source_department = source_department_var.get()
             target_stage = target_stage_var.get()
@@ -1230,59 +1370,28 @@ class AttendanceApp:
             ):
                 return
 
-            source_students = load_stage_department_students(source_stage, source_department)
-            target_students = load_stage_department_students(target_stage, target_department)
-            target_names = {s['name'] for s in target_students}
-
-            moved_students = []
-            skipped_duplicates = []
-            for student_name in selected_students:
-                student_to_move = None
-                for student in source_students:
-                    if student['name'] == student_name:
-                        student_to_move = student
-                        break
-
-                if student_to_move:
-                    if student_name in target_names:
-                        skipped_duplicates.append(student_name)
-                        continue
-
-                    target_students.append({"name": student_name, "stage": target_stage, "department": target_department})
-                    moved_students.append(student_name)
-                    target_names.add(student_name)
-
-                    for uid, student_data in card_students.items():
-                        if (student_data['name'] == student_name and
-                                student_data['stage'] == source_stage and
-                                student_data['department'] == source_department):
-                            card_students[uid]['stage'] = target_stage
-                            card_students[uid]['department'] = target_department
+            result = transfer_students(
+                source_stage, source_department,
+                target_stage, target_department,
+                selected_students
+            )
+            moved_students = result["moved"]
 
             if moved_students:
-                source_students = [s for s in source_students if s['name'] not in moved_students]
-
-                save_stage_department_students(source_stage, source_department, source_students)
-                save_stage_department_students(target_stage, target_department, target_students)
-                save_data(CARDS_FILE, card_students)
-
-                global all_students
-                all_students = []
-                for stg in STAGES:
-                    for dept in DEPARTMENTS:
-                        all_students.extend(load_stage_department_students(stg, dept))
-
                 messagebox.showinfo("✅ نجح", f"تم نقل {len(moved_students)} طالب بنجاح")
                 move_window.destroy()
 
                 self.search_student()
                 if self.showing_records:
                     self.update_records_display()
-            else:
-                if skipped_duplicates:
-                    messagebox.showwarning("تحذير", "الطلاب المحددون موجودون مسبقًا في القسم الهدف!")
-                else:
-                    messagebox.showwarning("تحذير", "لم يتم نقل أي طالب!")
+            elif result["failed"]:
+                messagebox.showerror("❌ خطأ", "فشل في حفظ النقل، لم يُحذف أي طالب من صفه الأصلي")
+                self.search_student()
+            else:
+                if result["skipped"]:
+                    messagebox.showwarning("تحذير", "الطلاب المحددون موجودون مسبقًا في القسم الهدف!")
+                else:
+                    messagebox.showwarning("تحذير", "لم يتم نقل أي طالب!")
 
         btn_frame = tk.Frame(move_window, bg="white")
         btn_frame.pack(pady=8)
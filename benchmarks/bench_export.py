@@ -0,0 +1,113 @@
+"""
+مقارنة زمن تصدير صف واحد بين الطريقة السابقة (pandas.to_excel ثم
+load_workbook وتنسيق كل خلية ثم حفظ ثانٍ) والكاتب أحادي المرور
+write_class_workbook.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_export.py --students 40 --repeat 24
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
+from openpyxl.worksheet.page import PageMargins
+
+from app.export import COLUMNS, build_class_rows, write_class_workbook
+from app.models import ARRIVAL, AttendanceEntry, parse_time
+
+
+def legacy_write_class_workbook(file_path, data):
+    rows = [
+        [
+            item["number"], item["name"], item["stage"], item["department"],
+            item["date"], item["attendance"], item["departure"], item["notes"]
+        ]
+        for item in data
+    ]
+    pd.DataFrame(rows, columns=COLUMNS).to_excel(file_path, index=False, engine="openpyxl")
+
+    wb = load_workbook(file_path)
+    ws = wb.active
+    ws.sheet_view.rightToLeft = True
+
+    thin = Side(style="thin")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    fills = {
+        "ت": PatternFill("solid", start_color="FFFF00"),
+        "الحضور": PatternFill("solid", start_color="9BBB59"),
+        "الانصراف": PatternFill("solid", start_color="87CEEB"),
+    }
+    gray = PatternFill("solid", start_color="D3D3D3")
+
+    for col_idx, header in enumerate(COLUMNS, start=1):
+        cell = ws.cell(row=1, column=col_idx)
+        cell.font = Font(bold=True, size=14)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        cell.border = border
+        cell.fill = fills.get(header, gray)
+
+    data_fill = PatternFill("solid", start_color="F0F8FF")
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=8):
+        for cell in row:
+            cell.font = Font(size=12)
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.fill = data_fill
+            cell.border = border
+
+    for letter, width in zip("ABCDEFGH", [5, 25, 15, 15, 12, 12, 12, 25]):
+        ws.column_dimensions[letter].width = width
+
+    ws.page_margins = PageMargins(left=0.3, right=0.3, top=0.4, bottom=0.4, header=0.3, footer=0.3)
+    ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE
+    ws.page_setup.paperSize = ws.PAPERSIZE_A4
+    ws.page_setup.fitToWidth = 1
+    ws.page_setup.fitToHeight = 0
+
+    wb.save(file_path)
+
+
+def make_class(students):
+    stage, department, day = "مرحلة أولى", "تجميع", "2025-09-01"
+    roster = [
+        {"id": i + 1, "name": f"طالب {i:03d}", "stage": stage, "department": department}
+        for i in range(students)
+    ]
+    attendance = {
+        s["id"]: {day: [AttendanceEntry(ARRIVAL, parse_time("08:00 AM"))]}
+        for s in roster[::2]
+    }
+    return build_class_rows(roster, attendance, stage, department, day)
+
+
+def bench(label, writer, data, repeat, folder):
+    start = time.perf_counter()
+    for i in range(repeat):
+        writer(os.path.join(folder, f"{label}_{i}.xlsx"), data)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {elapsed:8.3f}s  ({elapsed / repeat * 1000:.1f} ms/صف)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=24)
+    args = parser.parse_args()
+
+    data = make_class(args.students)
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{args.repeat} صف، {args.students} طالب لكل صف")
+        before = bench("legacy", legacy_write_class_workbook, data, args.repeat, folder)
+        after = bench("stream", write_class_workbook, data, args.repeat, folder)
+        print(f"التسريع: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+مقارنة قراءة أرشيف records عبر pd.read_excel مع القارئ المتدفق
+read_record_columns على سنة دراسية من ملفات وهمية.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_records_reader.py --days 180 --students 30
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from app.archive_scan import read_record_columns, _read_columns_openpyxl
+
+COLUMNS = [
+    "ت", "اسم", "المرحلة", "القسم",
+    "تاريخ", "الحضور", "الانصراف", "ملاحظات"
+]
+
+
+def make_archive(folder, days, students):
+    start = date(2025, 9, 1)
+    paths = []
+    for d in range(days):
+        day = (start + timedelta(days=d)).strftime("%Y-%m-%d")
+        rows = []
+        for i in range(students):
+            absent = (i + d) % 7 == 0
+            rows.append([
+                i + 1, f"طالب {i:03d}", "مرحلة أولى", "تجميع", day,
+                "غياب" if absent else "08:0{} AM".format(i % 10),
+                "غياب" if absent else "01:30 PM", ""
+            ])
+        path = os.path.join(folder, f"{day}.xlsx")
+        pd.DataFrame(rows, columns=COLUMNS).to_excel(path, index=False, engine="openpyxl")
+        paths.append(path)
+    return paths
+
+
+def read_with_pandas(path):
+    df = pd.read_excel(path)
+    return dict(zip(df["اسم"], df["الحضور"]))
+
+
+def read_streaming(path):
+    values = read_record_columns(path)
+    return dict(zip(values["اسم"], values["الحضور"]))
+
+
+def read_openpyxl_read_only(path):
+    values = _read_columns_openpyxl(path, ("اسم", "الحضور"))
+    return dict(zip(values["اسم"], values["الحضور"]))
+
+
+def bench(label, reader, paths):
+    start = time.perf_counter()
+    results = [reader(p) for p in paths]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.3f}s  ({elapsed / len(paths) * 1000:.2f} ms/ملف)")
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--students", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_archive(folder, args.days, args.students)
+        print(f"{len(paths)} ملف، {args.students} طالب لكل ملف")
+
+        pandas_results, pandas_time = bench("pd.read_excel", read_with_pandas, paths)
+        read_only_results, _ = bench("openpyxl read_only", read_openpyxl_read_only, paths)
+        stream_results, stream_time = bench("read_record_columns", read_streaming, paths)
+
+        assert pandas_results == read_only_results == stream_results
+        print(f"التسريع: {pandas_time / stream_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
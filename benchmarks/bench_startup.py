@@ -0,0 +1,53 @@
+"""
+قياس زمن استيراد app.ui (الجزء الذي يسبق ظهور النافذة) في عملية جديدة،
+والتأكد من أن openpyxl لا يُستورد ولا يُقرأ أي ملف بيانات قبل ظهورها.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.constants import STARTUP_TARGET_SECONDS
+
+PROBE = """
+import os, sys, time
+started = time.perf_counter()
+import app.ui
+elapsed = time.perf_counter() - started
+print(elapsed, "openpyxl" in sys.modules, os.path.exists("data"))
+"""
+
+
+def measure_once(workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1] == "True", output[2] == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [measure_once(workdir) for _ in range(args.repeat)]
+
+    times = sorted(elapsed for elapsed, _, _ in results)
+    print(f"import app.ui: أفضل {times[0]:.3f} ث، الوسيط {times[len(times) // 2]:.3f} ث")
+    print(f"الهدف حتى ظهور النافذة: {STARTUP_TARGET_SECONDS} ث")
+    print(f"openpyxl مستورد: {any(loaded for _, loaded, _ in results)}")
+    print(f"مجلد data أُنشئ عند الاستيراد: {any(created for _, _, created in results)}")
+
+
+if __name__ == "__main__":
+    main()
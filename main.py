@@ -1,9 +1,31 @@
+import sys
+import time
+import multiprocessing
 import tkinter as tk
-from app.ui import AttendanceApp
+
+from app.constants import STARTUP_TARGET_SECONDS
+
+
+def report_startup_time(started):
+    elapsed = time.perf_counter() - started
+    status = "ضمن الهدف" if elapsed <= STARTUP_TARGET_SECONDS else "أبطأ من الهدف"
+    print(f"ظهرت النافذة خلال {elapsed:.2f} ثانية ({status} {STARTUP_TARGET_SECONDS} ثانية)")
+
 
 def main():
+    started = time.perf_counter()
+    multiprocessing.freeze_support()
+
+    if "--rebuild-ledger" in sys.argv:
+        from app.ledger import rebuild_ledger
+        rebuild_ledger()
+        print("تمت إعادة بناء سجل الغياب من ملفات records")
+        return
+
+    from app.ui import AttendanceApp
     root = tk.Tk()
     app = AttendanceApp(root)
+    root.after_idle(report_startup_time, started)
     root.mainloop()
 
 if __name__ == "__main__":
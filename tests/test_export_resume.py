@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import export, ledger
+from app.attendance_store import AttendanceStore
+from app.constants import STAGES, DEPARTMENTS
+from app.models import ARRIVAL, AttendanceEntry
+from app.storage import create_folders, save_stage_department_students
+
+FIRST = (STAGES[0], DEPARTMENTS[0])
+SECOND = (STAGES[0], DEPARTMENTS[1])
+
+
+class Messages:
+    def __init__(self):
+        self.errors = []
+
+    def showinfo(self, title, message):
+        pass
+
+    def showerror(self, title, message):
+        self.errors.append(message)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    create_folders()
+    store = AttendanceStore()
+    monkeypatch.setattr(export, "attendance_store", store)
+    monkeypatch.setattr(export, "messagebox", Messages())
+    return store
+
+
+def add_student(student_id, stage, department):
+    student = {"id": student_id, "name": f"طالب {student_id}", "stage": stage, "department": department}
+    save_stage_department_students(stage, department, [student])
+    return student
+
+
+def exported_times(stage, department, date):
+    rows = export.read_previous_rows(export.get_record_file(stage, department, date))
+    return {name: times[0] for name, times in rows.items()}
+
+
+def test_resume_does_not_duplicate_written_class(store, monkeypatch):
+    today = datetime.now().strftime("%Y-%m-%d")
+    first = store.record(add_student(1, *FIRST))
+    second = store.record(add_student(2, *SECOND))
+
+    # ينقطع التصدير بعد استبدال ملف الصف الثاني وقبل تسجيله في committed
+    calls = []
+
+    def record_day(stage, department, date, statuses):
+        calls.append((stage, department))
+        if len(calls) == 2:
+            raise OSError("انقطاع")
+        return ledger.record_day(stage, department, date, statuses)
+
+    monkeypatch.setattr(export, "record_day", record_day)
+    export.export_data()
+    assert export.messagebox.errors
+
+    monkeypatch.setattr(export, "record_day", ledger.record_day)
+    export.export_data()
+
+    assert exported_times(*FIRST, today) == {"طالب 1": [first.time_text]}
+    assert exported_times(*SECOND, today) == {"طالب 2": [second.time_text]}
+    assert store.snapshot(*FIRST) == {}
+    assert store.snapshot(*SECOND) == {}
+
+
+def test_export_writes_pending_earlier_dates(store):
+    today = datetime.now().strftime("%Y-%m-%d")
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    add_student(1, *FIRST)
+    store.get(*FIRST)[1] = {yesterday: [AttendanceEntry(ARRIVAL, 480)]}
+
+    export.export_data()
+
+    assert exported_times(*FIRST, yesterday) == {"طالب 1": ["08:00 AM"]}
+    assert exported_times(*FIRST, today) == {"طالب 1": []}
+    assert store.snapshot(*FIRST) == {}
@@ -0,0 +1,46 @@
+import pytest
+
+from app import storage, sqlite_storage
+from app.attendance_store import AttendanceStore
+from app.constants import STAGES, DEPARTMENTS
+
+SOURCE = (STAGES[0], DEPARTMENTS[0])
+TARGET = (STAGES[0], DEPARTMENTS[1])
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sqlite_storage, "_connection", None)
+    storage.use_backend("sqlite")
+    yield
+    storage.use_backend("json")
+    if sqlite_storage._connection is not None:
+        sqlite_storage._connection.close()
+
+
+def test_transfer_keeps_attendance_in_database(sqlite_backend):
+    student = {"id": 1, "name": "أحمد", "stage": SOURCE[0], "department": SOURCE[1]}
+
+    store = AttendanceStore()
+    entry = store.record(student)
+    assert store.transfer(*SOURCE, *TARGET, [1])
+
+    assert sqlite_storage.load_stage_department_attendance(*SOURCE) == {}
+    assert sqlite_storage.load_stage_department_attendance(*TARGET) == {
+        "1": {date: [entry.to_dict()] for date in store.get(*TARGET)[1]}
+    }
+
+    # بعد إعادة التشغيل تُقرأ السجلات من قاعدة البيانات فقط
+    reloaded = AttendanceStore()
+    assert reloaded.get(*SOURCE) == {}
+    assert list(reloaded.get(*TARGET)) == [1]
+
+
+def test_class_rewrite_replaces_rows_saved_under_old_class(sqlite_backend):
+    event = {"type": "حضور", "time": "08:00 AM"}
+    sqlite_storage.append_attendance_events(*SOURCE, [(1, "2026-10-18", event, 0)])
+
+    assert sqlite_storage.save_stage_department_attendance(*TARGET, {1: {"2026-10-18": [event]}})
+    assert sqlite_storage.save_stage_department_attendance(*SOURCE, {})
+    assert sqlite_storage.load_stage_department_attendance(*TARGET) == {"1": {"2026-10-18": [event]}}